@@ -1,11 +1,40 @@
-import configparser
 import os
 import logging
+import re
+from functools import lru_cache
 
 CONFIG_FILE_PATH = 'config.ini'
 VERSION_FILE_PATH = '__version__.py' # Path to the version file
+# Same boolean spellings configparser's getboolean() accepts
+_BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,
+                   '0': False, 'no': False, 'false': False, 'off': False}
+_TRUTHY = frozenset({'true', '1', 't', 'y', 'yes'}) # Env var values treated as True
+_VERSION_RE = re.compile(r"""^__version__\s*=\s*['"]([^'"]+)['"]""", re.MULTILINE)
+_INI_OPTION_RE = re.compile(r'^([^=:]+?)\s*[=:]\s*(.*)$')
 
-# Function to read the version from __version__.py
+def _parse_ini(path) -> dict[str, dict[str, str]]:
+    """Reads a simple INI file into {section: {option: value}}.
+    Supports [Section] headers, 'key = value' / 'key: value' options and full-line '#' / ';' comments.
+    Option names are lowercased, as configparser does. Raises ValueError on malformed lines.
+    """
+    data = {}
+    section = None
+    with open(path, 'r') as f:
+        for lineno, raw_line in enumerate(f, 1):
+            line = raw_line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line[0] == '[' and line[-1] == ']':
+                section = data.setdefault(line[1:-1].strip(), {})
+                continue
+            match = _INI_OPTION_RE.match(line)
+            if section is None or not match:
+                raise ValueError(f"Malformed line {lineno}: {line!r}")
+            section[match.group(1).lower()] = match.group(2)
+    return data
+
+# Function to read the version from __version__.py (read once per process)
+@lru_cache(maxsize=1)
 def get_application_version():
     version = "unknown"
     version_file = os.path.join(os.path.dirname(__file__), VERSION_FILE_PATH) # Ensure correct path relative to config_manager.py
@@ -22,68 +51,74 @@ def get_application_version():
             
     try:
         with open(version_file, 'r') as f:
-            for line in f:
-                if line.startswith('__version__'):
-                    # Execute the line in a restricted scope to get the value
-                    # This is safer than direct exec() if the file could be complex,
-                    # but for a simple __version__ = "x.y.z" it's okay.
-                    # A more robust way might be to parse it with ast.
-                    local_vars = {}
-                    exec(line, {}, local_vars)
-                    version = local_vars.get('__version__', version)
-                    break
+            match = _VERSION_RE.search(f.read())
+        if match:
+            version = match.group(1)
+        else:
+            logging.warning(f"No __version__ assignment found in {version_file}.")
     except Exception as e:
         logging.error(f"Could not read version from {version_file}: {e}")
     return version
 
 class ConfigManager:
     def __init__(self, config_file=CONFIG_FILE_PATH):
-        self.parser = configparser.ConfigParser()
+        self._cache = {} # Resolved values keyed by the arguments passed to get()
+        # Environment snapshot; changes made to os.environ after this point are not seen until invalidate()
+        self._env = dict(os.environ)
+        # Plain {section: {option: value}} contents of the config file
+        self._data = {}
         if not os.path.exists(config_file):
             logging.warning(f"Config file '{config_file}' not found. Using default values and environment variables where possible.")
-            # Create a dummy parser if file not found, so sections exist for env var overrides
-            self._create_default_sections_for_env_override()
         else:
             try:
-                self.parser.read(config_file)
-            except configparser.Error as e:
+                self._data = _parse_ini(config_file)
+            except (OSError, ValueError) as e:
                 logging.error(f"Error reading config file '{config_file}': {e}. Using defaults/env vars.")
-                self._create_default_sections_for_env_override()
 
-    def _create_default_sections_for_env_override(self):
-        """Ensures sections exist in the parser even if the file is missing, for env var lookups."""
-        sections = ['General', 'IPFS', 'Substrate', 'Database', 'MinerService']
-        for section in sections:
-            if not self.parser.has_section(section):
-                self.parser.add_section(section)
+    def invalidate(self):
+        """Drops all cached values and re-snapshots os.environ for the next get()."""
+        self._cache.clear()
+        self._env = dict(os.environ)
 
     def get(self, section, key, default=None, is_int=False, is_bool=False, env_var=None):
-        """Fetches a config value, checking environment variables first, then config file, then default."""
+        """Fetches a config value, checking environment variables first, then config file, then default.
+        Resolved values are cached; call invalidate() to pick up later changes.
+        """
+        cache_key = (section, key, default, is_int, is_bool, env_var)
+        try:
+            return self._cache[cache_key]
+        except KeyError:
+            pass
+        value = self._resolve(section, key, default, is_int, is_bool, env_var)
+        self._cache[cache_key] = value
+        return value
+
+    def _resolve(self, section, key, default, is_int, is_bool, env_var):
+        """Resolves a config value without consulting the cache."""
         # 1. Check environment variable
         if env_var:
-            value = os.environ.get(env_var)
+            value = self._env.get(env_var)
             if value is not None:
                 if is_int:
                     try: return int(value)
                     except ValueError: logging.warning(f"Env var {env_var}={value} is not a valid int. Ignoring.")
                 elif is_bool:
-                    return value.lower() in ['true', '1', 't', 'y', 'yes']
+                    return value.lower() in _TRUTHY
                 return value
         
-        # 2. Check config file
-        try:
-            if self.parser.has_option(section, key):
+        # 2. Check config file (option names are stored lowercased)
+        value = self._data.get(section, {}).get(key.lower())
+        if value is None:
+            logging.debug(f"Option '{key}' not found in section '{section}'. Using default.")
+        else:
+            try:
                 if is_int:
-                    return self.parser.getint(section, key)
+                    return int(value)
                 elif is_bool:
-                    return self.parser.getboolean(section, key)
-                return self.parser.get(section, key)
-        except configparser.NoSectionError:
-            logging.debug(f"Section '{section}' not found in config file. Using default for {key}.")
-        except configparser.NoOptionError:
-            logging.debug(f"Option '{key}' not found in section '{section}'. Using default.")
-        except ValueError as e:
-             logging.warning(f"Error parsing {section}.{key} from config: {e}. Using default.")
+                    return _BOOLEAN_STATES[value.lower()]
+                return value
+            except (ValueError, KeyError):
+                logging.warning(f"Error parsing {section}.{key} from config: invalid value '{value}'. Using default.")
 
         # 3. Return default
         return default
@@ -94,20 +129,36 @@ config = ConfigManager()
 # Application version
 APP_VERSION = get_application_version()
 
-# Example of how to define specific config properties for easy access
-LOG_LEVEL = config.get('General', 'LOG_LEVEL', default='INFO', env_var='LOG_LEVEL')
+# Module-level settings for easy access: (name, section, key, default, type, env var)
+_SETTINGS_SPEC = (
+    ('LOG_LEVEL', 'General', 'LOG_LEVEL', 'INFO', str, 'LOG_LEVEL'),
+
+    ('IPFS_API_HOST', 'IPFS', 'API_HOST', '127.0.0.1', str, 'IPFS_API_HOST'),
+    ('IPFS_API_PORT', 'IPFS', 'API_PORT', 5001, int, 'IPFS_API_PORT'),
+    ('IPFS_API_SOCKET', 'IPFS', 'API_SOCKET', '', str, 'IPFS_API_SOCKET'),
+    ('PIN_BATCH_MAX_SIZE', 'IPFS', 'PIN_BATCH_MAX_SIZE', 64, int, 'PIN_BATCH_MAX_SIZE'),
+    ('PIN_BATCH_MAX_DELAY_MS', 'IPFS', 'PIN_BATCH_MAX_DELAY_MS', 20, int, 'PIN_BATCH_MAX_DELAY_MS'),
 
-IPFS_API_HOST = config.get('IPFS', 'API_HOST', default='127.0.0.1', env_var='IPFS_API_HOST')
-IPFS_API_PORT = config.get('IPFS', 'API_PORT', default=5001, is_int=True, env_var='IPFS_API_PORT')
+    ('SUBSTRATE_NODE_URL', 'Substrate', 'NODE_URL', 'ws://127.0.0.1:9944', str, 'SUBSTRATE_NODE_URL'),
+    ('SUBSTRATE_POOL_SIZE', 'Substrate', 'POOL_SIZE', 4, int, 'SUBSTRATE_POOL_SIZE'),
 
-SUBSTRATE_NODE_URL = config.get('Substrate', 'NODE_URL', default='ws://127.0.0.1:9944', env_var='SUBSTRATE_NODE_URL')
+    ('DATABASE_NAME', 'Database', 'NAME', 'miner_data.db', str, 'DATABASE_NAME'),
 
-DATABASE_NAME = config.get('Database', 'NAME', default='miner_data.db', env_var='DATABASE_NAME')
+    ('POLLING_INTERVAL_SECONDS', 'MinerService', 'POLLING_INTERVAL_SECONDS', 60, int, 'POLLING_INTERVAL_SECONDS'),
+    ('MAX_PIN_RETRIES', 'MinerService', 'MAX_PIN_RETRIES', 5, int, 'MAX_PIN_RETRIES'),
+    ('PIN_CONCURRENCY', 'MinerService', 'PIN_CONCURRENCY', 16, int, 'PIN_CONCURRENCY'),
+    ('UNPINNABLE_CIDS_REPORT_FILE', 'MinerService', 'UNPINNABLE_CIDS_REPORT_FILE', 'unpinnable_cids_report.jsonl', str, 'UNPINNABLE_CIDS_REPORT_FILE'),
+    ('GC_TRIGGER_INTERVAL_LOOPS', 'MinerService', 'GC_TRIGGER_INTERVAL_LOOPS', 10, int, 'GC_TRIGGER_INTERVAL_LOOPS'),
+    ('RECONCILE_INTERVAL_LOOPS', 'MinerService', 'RECONCILE_INTERVAL_LOOPS', 10, int, 'RECONCILE_INTERVAL_LOOPS'),
+)
 
-POLLING_INTERVAL_SECONDS = config.get('MinerService', 'POLLING_INTERVAL_SECONDS', default=60, is_int=True, env_var='POLLING_INTERVAL_SECONDS')
-MAX_PIN_RETRIES = config.get('MinerService', 'MAX_PIN_RETRIES', default=5, is_int=True, env_var='MAX_PIN_RETRIES')
-UNPINNABLE_CIDS_REPORT_FILE = config.get('MinerService', 'UNPINNABLE_CIDS_REPORT_FILE', default='unpinnable_cids_report.json', env_var='UNPINNABLE_CIDS_REPORT_FILE')
-GC_TRIGGER_INTERVAL_LOOPS = config.get('MinerService', 'GC_TRIGGER_INTERVAL_LOOPS', default=10, is_int=True, env_var='GC_TRIGGER_INTERVAL_LOOPS')
+# Defines LOG_LEVEL, IPFS_API_HOST, IPFS_API_PORT, IPFS_API_SOCKET, PIN_BATCH_MAX_SIZE, PIN_BATCH_MAX_DELAY_MS,
+# SUBSTRATE_NODE_URL, SUBSTRATE_POOL_SIZE, DATABASE_NAME, POLLING_INTERVAL_SECONDS, MAX_PIN_RETRIES, PIN_CONCURRENCY,
+# UNPINNABLE_CIDS_REPORT_FILE, GC_TRIGGER_INTERVAL_LOOPS and RECONCILE_INTERVAL_LOOPS
+globals().update({
+    name: config.get(section, key, default=default, is_int=(kind is int), is_bool=(kind is bool), env_var=env_var)
+    for name, section, key, default, kind, env_var in _SETTINGS_SPEC
+})
 
 if __name__ == '__main__':
     # Test the config manager
@@ -116,12 +167,18 @@ if __name__ == '__main__':
     logging.info(f"Log Level: {LOG_LEVEL}")
     logging.info(f"IPFS API Host: {IPFS_API_HOST}")
     logging.info(f"IPFS API Port: {IPFS_API_PORT}")
+    logging.info(f"IPFS API Socket: {IPFS_API_SOCKET or '(not set, using TCP)'}")
+    logging.info(f"Pin Batch Max Size: {PIN_BATCH_MAX_SIZE}")
+    logging.info(f"Pin Batch Max Delay: {PIN_BATCH_MAX_DELAY_MS}ms")
     logging.info(f"Substrate Node URL: {SUBSTRATE_NODE_URL}")
+    logging.info(f"Substrate Pool Size: {SUBSTRATE_POOL_SIZE}")
     logging.info(f"Database Name: {DATABASE_NAME}")
     logging.info(f"Polling Interval: {POLLING_INTERVAL_SECONDS}s")
     logging.info(f"Max Pin Retries: {MAX_PIN_RETRIES}")
+    logging.info(f"Pin Concurrency: {PIN_CONCURRENCY}")
     logging.info(f"Unpinnable CIDs Report File: {UNPINNABLE_CIDS_REPORT_FILE}")
     logging.info(f"GC Trigger Interval Loops: {GC_TRIGGER_INTERVAL_LOOPS}")
+    logging.info(f"Reconcile Interval Loops: {RECONCILE_INTERVAL_LOOPS}")
 
     # Example of testing an env var override
     # Set an env var like: export TEST_ENV_OVERRIDE="overridden_value"
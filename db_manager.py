@@ -1,125 +1,275 @@
 # Database management functions
+import asyncio
 import aiosqlite
 import logging
-# import config_manager # This will be the new way
-from config_manager import DATABASE_NAME # Directly import the specific config
-
+from contextlib import asynccontextmanager
 # DATABASE_NAME = "miner_data.db" # Old way
 
+# Resolved from config_manager on first use so importing this module doesn't load the config
+_database_name: str | None = None
+
+def _get_database_name() -> str:
+    """Returns the configured database file name, reading config_manager.DATABASE_NAME once."""
+    global _database_name
+    if _database_name is None:
+        import config_manager
+        _database_name = config_manager.DATABASE_NAME
+    return _database_name
+
+# Long-lived connection shared by all helpers (opened lazily by get_db())
+_db: aiosqlite.Connection | None = None
+# Serializes write transactions on the shared connection
+_write_lock = asyncio.Lock()
+
+# Maximum number of bound parameters per IN (...) clause (SQLite's historical default limit is 999)
+_IN_CLAUSE_CHUNK_SIZE = 500
+
+# Hot statements, passed verbatim so sqlite3's per-connection statement cache reuses their prepared handles
+_SQL_INSERT_PENDING = "INSERT OR IGNORE INTO pinned_cids (cid, status, retry_count) VALUES (?, 'pending_pin', 0)"
+_SQL_UPDATE_FAILED_TO_PENDING = "UPDATE pinned_cids SET status = 'pending_pin', retry_count = 0 WHERE cid = ? AND status = 'failed_pin'"
+_SQL_UPDATE_STATUS_RETRY = "UPDATE pinned_cids SET status = ?, retry_count = ?, last_checked = CURRENT_TIMESTAMP WHERE cid = ?"
+_SQL_UPDATE_STATUS = "UPDATE pinned_cids SET status = ?, last_checked = CURRENT_TIMESTAMP WHERE cid = ?"
+_SQL_SELECT_BY_STATUS = "SELECT cid, retry_count FROM pinned_cids WHERE status = ?"
+_SQL_SELECT_RETRYABLE = "SELECT cid, status, retry_count FROM pinned_cids WHERE status IN ('pending_pin', 'failed_pin') AND retry_count < ?"
+_SQL_COPY_MAXED_OUT_TO_UNPINNABLE = """
+    INSERT OR REPLACE INTO unpinnable_cids (cid, reason, last_retry_timestamp)
+    SELECT cid, 'Reached max retries (' || retry_count || ') in failed_pin state.', CURRENT_TIMESTAMP
+    FROM pinned_cids WHERE status = 'failed_pin' AND retry_count >= ?
+"""
+_SQL_DELETE_MAXED_OUT = "DELETE FROM pinned_cids WHERE status = 'failed_pin' AND retry_count >= ?"
+# Temporary (per-connection) table holding the IPFS pin list while diff_pinned_cids() compares it with pinned_cids
+_SQL_CREATE_IPFS_SNAPSHOT = "CREATE TEMP TABLE IF NOT EXISTS ipfs_snapshot (cid TEXT PRIMARY KEY)"
+_SQL_CLEAR_IPFS_SNAPSHOT = "DELETE FROM ipfs_snapshot"
+_SQL_INSERT_IPFS_SNAPSHOT = "INSERT OR IGNORE INTO ipfs_snapshot (cid) VALUES (?)"
+_SQL_SELECT_ONLY_IN_IPFS = "SELECT cid FROM ipfs_snapshot EXCEPT SELECT cid FROM pinned_cids WHERE status IN ('pinned', 'pending_pin')"
+_SQL_SELECT_ONLY_IN_DB = "SELECT cid, retry_count FROM pinned_cids WHERE status IN ('pinned', 'pending_pin') AND cid NOT IN (SELECT cid FROM ipfs_snapshot)"
+_SQL_SELECT_PINNED_ONLY_IN_DB = "SELECT cid, retry_count FROM pinned_cids WHERE status = 'pinned' AND cid NOT IN (SELECT cid FROM ipfs_snapshot)"
+# Temporary (per-connection) table holding a profile's CIDs while sync_profile_cids() applies them
+_SQL_CREATE_PROFILE_SNAPSHOT = "CREATE TEMP TABLE IF NOT EXISTS profile_snapshot (cid TEXT PRIMARY KEY)"
+_SQL_CLEAR_PROFILE_SNAPSHOT = "DELETE FROM profile_snapshot"
+_SQL_INSERT_PROFILE_SNAPSHOT = "INSERT OR IGNORE INTO profile_snapshot (cid) VALUES (?)"
+_SQL_SELECT_MANAGED_NOT_IN_PROFILE = "SELECT cid FROM pinned_cids WHERE status IN ('pinned', 'pending_pin', 'failed_pin') AND cid NOT IN (SELECT cid FROM profile_snapshot)"
+_SQL_SELECT_CID_DETAILS = "SELECT cid, status, retry_count FROM pinned_cids WHERE cid = ?"
+_SQL_DELETE_CID = "DELETE FROM pinned_cids WHERE cid = ?"
+_SQL_UPSERT_UNPINNABLE = "INSERT OR REPLACE INTO unpinnable_cids (cid, reason, last_retry_timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)"
+_SQL_SELECT_UNREPORTED = "SELECT cid, reason FROM unpinnable_cids WHERE reported = FALSE"
+_SQL_DEACTIVATE_PROFILES = "UPDATE miner_profile SET is_active = FALSE, pinned_locally = FALSE WHERE is_active = TRUE"
+_SQL_SELECT_ACTIVE_PROFILE = "SELECT profile_cid, pinned_locally FROM miner_profile WHERE is_active = TRUE"
+_SQL_UPDATE_PROFILE_PINNED = "UPDATE miner_profile SET pinned_locally = ? WHERE profile_cid = ? AND is_active = TRUE"
+_STATEMENT_CACHE_SIZE = 256 # sqlite3 default is 128
+
+# Applied to every new connection. WAL + synchronous=NORMAL cuts fsyncs to roughly one per commit
+# and lets readers proceed alongside the writer; journal_mode=WAL is persisted in the database file.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-20000",    # ~20 MB page cache
+    "PRAGMA temp_store=MEMORY",
+)
+
+async def get_db() -> aiosqlite.Connection:
+    """Returns the shared database connection, opening it on first use."""
+    global _db
+    if _db is None:
+        _db = await aiosqlite.connect(_get_database_name(), cached_statements=_STATEMENT_CACHE_SIZE)
+        for pragma in _CONNECTION_PRAGMAS:
+            await _db.execute(pragma)
+        logging.debug(f"Opened shared database connection to '{_get_database_name()}'.")
+    return _db
+
+@asynccontextmanager
+async def _transaction():
+    """Runs the enclosed statements as one BEGIN IMMEDIATE ... COMMIT on the shared connection.
+    Rolls back on error. Writers are serialized so transactions from concurrent tasks don't interleave.
+    """
+    async with _write_lock:
+        db = await get_db()
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
+async def close_database():
+    """Closes the shared database connection if it is open."""
+    global _db
+    if _db is not None:
+        try:
+            await _db.close()
+            logging.debug(f"Closed shared database connection to '{_get_database_name()}'.")
+        except aiosqlite.Error as e:
+            logging.error(f"Error closing database connection: {e}")
+        finally:
+            _db = None
+
 async def initialize_database():
     """Initializes the database and creates tables if they don\'t exist."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            # Table for CIDs managed by the miner
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS pinned_cids (
-                    cid TEXT PRIMARY KEY,
-                    status TEXT NOT NULL CHECK(status IN ('pinned', 'pending_pin', 'failed_pin', 'unpin_requested', 'unpinned')),
-                    last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    retry_count INTEGER DEFAULT 0
-                )
-            ''')
-
-            # Table to store the miner's own profile CID
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS miner_profile (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    profile_cid TEXT UNIQUE NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE, 
-                    pinned_locally BOOLEAN DEFAULT FALSE,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            # Ensure only one profile can be active
-            await db.execute('''
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_active_profile
-                ON miner_profile (is_active)
-                WHERE is_active = TRUE;
-            ''')
-
-            # Table for CIDs that could not be pinned after retries
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS unpinnable_cids (
-                    cid TEXT PRIMARY KEY,
-                    reason TEXT,
-                    reported BOOLEAN DEFAULT FALSE,
-                    first_failure_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_retry_timestamp TIMESTAMP
-                )
-            ''')
+        db = await get_db()
+        # Table for CIDs managed by the miner
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS pinned_cids (
+                cid TEXT PRIMARY KEY,
+                status TEXT NOT NULL CHECK(status IN ('pinned', 'pending_pin', 'failed_pin', 'unpin_requested', 'unpinned')),
+                last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                retry_count INTEGER DEFAULT 0
+            )
+        ''')
 
-            await db.commit()
-            logging.info(f"Database '{DATABASE_NAME}' initialized successfully.")
+        # Table to store the miner's own profile CID
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS miner_profile (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                profile_cid TEXT UNIQUE NOT NULL,
+                is_active BOOLEAN DEFAULT TRUE, 
+                pinned_locally BOOLEAN DEFAULT FALSE,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Ensure only one profile can be active
+        await db.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_active_profile
+            ON miner_profile (is_active)
+            WHERE is_active = TRUE;
+        ''')
+
+        # Table for CIDs that could not be pinned after retries
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS unpinnable_cids (
+                cid TEXT PRIMARY KEY,
+                reason TEXT,
+                reported BOOLEAN DEFAULT FALSE,
+                first_failure_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_retry_timestamp TIMESTAMP
+            )
+        ''')
+
+        # Covering index for the status-filtered pinned_cids queries (get_cids_by_status, get_retryable_pins, diff_pinned_cids)
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_pinned_cids_status
+            ON pinned_cids (status, cid, retry_count)
+        ''')
+        # Partial index for unreported unpinnable CIDs (get_unpinnable_cids_to_report)
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_unpinnable_reported
+            ON unpinnable_cids (reported)
+            WHERE reported = FALSE
+        ''')
+
+        await db.commit()
+        logging.info(f"Database '{_get_database_name()}' initialized successfully.")
     except aiosqlite.Error as e:
         logging.error(f"Database initialization error: {e}")
         raise
 
+async def _queue_cids_for_pinning(db: aiosqlite.Connection, cids: list[str]):
+    """Inserts CIDs as 'pending_pin' and resets previously failed ones, without committing."""
+    params = [(cid,) for cid in cids]
+    await db.executemany(_SQL_INSERT_PENDING, params)
+    # If any were previously failed, update status and reset retries
+    await db.executemany(_SQL_UPDATE_FAILED_TO_PENDING, params)
+
 async def add_cid_to_pin(cid: str):
     """Adds a CID to the pinned_cids table with 'pending_pin' status."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            await db.execute(
-                "INSERT OR IGNORE INTO pinned_cids (cid, status, retry_count) VALUES (?, 'pending_pin', 0)",
-                (cid,)
-            )
-            # If it was previously failed, update status and reset retries
-            await db.execute(
-                "UPDATE pinned_cids SET status = 'pending_pin', retry_count = 0 WHERE cid = ? AND status = 'failed_pin'",
-                (cid,)
-            )
-            await db.commit()
-            logging.info(f"CID {cid} added/updated for pinning.")
+        async with _transaction() as db:
+            await _queue_cids_for_pinning(db, [cid])
+        logging.info(f"CID {cid} added/updated for pinning.")
     except aiosqlite.Error as e:
         logging.error(f"Error adding CID {cid} to pin: {e}")
 
 async def update_cid_status(cid: str, status: str, retry_count: int = None):
     """Updates the status and optionally retry count of a CID in pinned_cids."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
+        async with _transaction() as db:
             if retry_count is not None:
-                await db.execute(
-                    "UPDATE pinned_cids SET status = ?, retry_count = ?, last_checked = CURRENT_TIMESTAMP WHERE cid = ?",
-                    (status, retry_count, cid)
-                )
+                await db.execute(_SQL_UPDATE_STATUS_RETRY, (status, retry_count, cid))
             else:
-                await db.execute(
-                    "UPDATE pinned_cids SET status = ?, last_checked = CURRENT_TIMESTAMP WHERE cid = ?",
-                    (status, cid)
-                )
-            await db.commit()
-            logging.debug(f"CID {cid} status updated to {status}" + (f", retry count {retry_count}" if retry_count is not None else ""))
+                await db.execute(_SQL_UPDATE_STATUS, (status, cid))
+        logging.debug(f"CID {cid} status updated to {status}" + (f", retry count {retry_count}" if retry_count is not None else ""))
     except aiosqlite.Error as e:
         logging.error(f"Error updating status for CID {cid}: {e}")
 
+async def update_cid_statuses(updates: list[tuple[str, str, int | None]]):
+    """Applies several (cid, status, retry_count) updates in a single transaction.
+    A retry_count of None leaves the stored count unchanged, as with update_cid_status().
+    """
+    if not updates:
+        return
+    try:
+        async with _transaction() as db:
+            await db.executemany(_SQL_UPDATE_STATUS, [(status, cid) for cid, status, retry_count in updates if retry_count is None])
+            await db.executemany(_SQL_UPDATE_STATUS_RETRY, [(status, retry_count, cid) for cid, status, retry_count in updates if retry_count is not None])
+        logging.debug(f"Updated the status of {len(updates)} CIDs.")
+    except aiosqlite.Error as e:
+        logging.error(f"Error updating status for {len(updates)} CIDs: {e}")
+
 async def get_cids_by_status(status: str):
     """Retrieves all CIDs with a specific status."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            async with db.execute("SELECT cid, retry_count FROM pinned_cids WHERE status = ?", (status,)) as cursor:
-                return await cursor.fetchall()
+        db = await get_db()
+        async with db.execute(_SQL_SELECT_BY_STATUS, (status,)) as cursor:
+            return await cursor.fetchall()
     except aiosqlite.Error as e:
         logging.error(f"Error fetching CIDs with status {status}: {e}")
         return []
 
+async def get_retryable_pins(max_retries: int):
+    """Retrieves (cid, status, retry_count) for 'pending_pin' and 'failed_pin' CIDs with fewer than max_retries attempts."""
+    try:
+        db = await get_db()
+        async with db.execute(_SQL_SELECT_RETRYABLE, (max_retries,)) as cursor:
+            return await cursor.fetchall()
+    except aiosqlite.Error as e:
+        logging.error(f"Error fetching retryable CIDs: {e}")
+        return []
+
+async def retire_maxed_out_pins(max_retries: int) -> int:
+    """Moves every 'failed_pin' CID with at least max_retries attempts to unpinnable_cids, in one transaction.
+    Returns the number of CIDs moved.
+    """
+    try:
+        async with _transaction() as db:
+            await db.execute(_SQL_COPY_MAXED_OUT_TO_UNPINNABLE, (max_retries,))
+            cursor = await db.execute(_SQL_DELETE_MAXED_OUT, (max_retries,))
+            moved = cursor.rowcount
+        if moved:
+            logging.warning(f"{moved} CIDs reached max retries ({max_retries}) and were marked as unpinnable.")
+        return moved
+    except aiosqlite.Error as e:
+        logging.error(f"Error retiring CIDs that reached max retries: {e}")
+        return 0
+
 async def add_unpinnable_cid(cid: str, reason: str):
     """Adds a CID to the unpinnable_cids table."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            await db.execute(
-                "INSERT OR REPLACE INTO unpinnable_cids (cid, reason, last_retry_timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)",
-                (cid, reason)
-            )
-            await db.commit()
-            logging.warning(f"CID {cid} marked as unpinnable. Reason: {reason}")
+        async with _transaction() as db:
+            await db.execute(_SQL_UPSERT_UNPINNABLE, (cid, reason))
+        logging.warning(f"CID {cid} marked as unpinnable. Reason: {reason}")
     except aiosqlite.Error as e:
         logging.error(f"Error adding unpinnable CID {cid}: {e}")
 
+async def mark_cids_unpinnable(entries: list[tuple[str, str]]):
+    """Moves several (cid, reason) entries from pinned_cids to unpinnable_cids in a single transaction."""
+    if not entries:
+        return
+    try:
+        async with _transaction() as db:
+            await db.executemany(_SQL_DELETE_CID, [(cid,) for cid, _ in entries])
+            await db.executemany(_SQL_UPSERT_UNPINNABLE, entries)
+        logging.warning(f"{len(entries)} CIDs marked as unpinnable.")
+    except aiosqlite.Error as e:
+        logging.error(f"Error marking {len(entries)} CIDs as unpinnable: {e}")
+
 async def get_unpinnable_cids_to_report():
     """Retrieves unpinnable CIDs that have not been reported yet."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            async with db.execute("SELECT cid, reason FROM unpinnable_cids WHERE reported = FALSE") as cursor:
-                return await cursor.fetchall()
+        db = await get_db()
+        async with db.execute(_SQL_SELECT_UNREPORTED) as cursor:
+            return await cursor.fetchall()
     except aiosqlite.Error as e:
         logging.error(f"Error fetching unpinnable CIDs to report: {e}")
         return []
@@ -129,14 +279,16 @@ async def mark_unpinnable_cids_as_reported(cids: list[str]):
     if not cids:
         return
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            placeholders = ','.join('?' for _ in cids)
-            await db.execute(
-                f"UPDATE unpinnable_cids SET reported = TRUE WHERE cid IN ({placeholders})",
-                cids
-            )
-            await db.commit()
-            logging.info(f"Marked {len(cids)} CIDs as reported: {cids}")
+        async with _transaction() as db:
+            # Keep each IN-clause below SQLite's bound-parameter limit; all chunks share one commit
+            for i in range(0, len(cids), _IN_CLAUSE_CHUNK_SIZE):
+                chunk = cids[i:i + _IN_CLAUSE_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                await db.execute(
+                    f"UPDATE unpinnable_cids SET reported = TRUE WHERE cid IN ({placeholders})",
+                    chunk
+                )
+        logging.info(f"Marked {len(cids)} CIDs as reported.")
     except aiosqlite.Error as e:
         logging.error(f"Error marking CIDs as reported: {e}")
 
@@ -145,9 +297,9 @@ async def set_active_miner_profile(profile_cid: str | None):
        If profile_cid is None, deactivates any current active profile.
     """
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
+        async with _transaction() as db:
             # Deactivate any existing active profile
-            await db.execute("UPDATE miner_profile SET is_active = FALSE, pinned_locally = FALSE WHERE is_active = TRUE")
+            await db.execute(_SQL_DEACTIVATE_PROFILES)
             
             if profile_cid:
                 # Insert or update the new profile
@@ -161,14 +313,14 @@ async def set_active_miner_profile(profile_cid: str | None):
                         last_updated = CURRENT_TIMESTAMP
                     ''', (profile_cid,)
                 )
-                logging.info(f"Active miner profile set to {profile_cid}")
-                # Ensure this profile document CID is in pinned_cids to be managed by the pinning process
-                await add_cid_to_pin(profile_cid) 
-                # Its status will be updated to 'pinned' by the standard pinning logic if successful
-            else:
-                logging.info("No active miner profile set (or current profile deactivated).")
-            
-            await db.commit()
+                # Ensure this profile document CID is in pinned_cids to be managed by the pinning process,
+                # as part of the same transaction. Its status will be updated to 'pinned' by the standard
+                # pinning logic if successful.
+                await _queue_cids_for_pinning(db, [profile_cid])
+        if profile_cid:
+            logging.info(f"Active miner profile set to {profile_cid}")
+        else:
+            logging.info("No active miner profile set (or current profile deactivated).")
 
     except aiosqlite.Error as e:
         logging.error(f"Error setting active miner profile (value: {profile_cid}): {e}")
@@ -177,9 +329,9 @@ async def set_active_miner_profile(profile_cid: str | None):
 async def get_active_miner_profile() -> tuple | None:
     """Retrieves the active miner profile CID and its pinned status."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            async with db.execute("SELECT profile_cid, pinned_locally FROM miner_profile WHERE is_active = TRUE") as cursor:
-                return await cursor.fetchone()
+        db = await get_db()
+        async with db.execute(_SQL_SELECT_ACTIVE_PROFILE) as cursor:
+            return await cursor.fetchone()
     except aiosqlite.Error as e:
         logging.error(f"Error fetching active miner profile: {e}")
         return None
@@ -187,43 +339,86 @@ async def get_active_miner_profile() -> tuple | None:
 async def update_miner_profile_pinned_status(profile_cid: str, pinned: bool):
     """Updates the pinned_locally status of the miner profile."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            await db.execute(
-                "UPDATE miner_profile SET pinned_locally = ? WHERE profile_cid = ? AND is_active = TRUE",
-                (pinned, profile_cid)
-            )
-            await db.commit()
-            logging.info(f"Miner profile {profile_cid} pinned_locally status updated to {pinned}")
+        async with _transaction() as db:
+            await db.execute(_SQL_UPDATE_PROFILE_PINNED, (pinned, profile_cid))
+        logging.info(f"Miner profile {profile_cid} pinned_locally status updated to {pinned}")
     except aiosqlite.Error as e:
         logging.error(f"Error updating miner profile {profile_cid} pinned status: {e}")
 
-async def get_all_pinned_cids_from_db():
-    """Retrieves all CIDs that are currently marked as 'pinned' or 'pending_pin' in the database."""
+async def sync_profile_cids(profile_cids, keep_cids) -> tuple[int, list[str]]:
+    """Brings pinned_cids in line with a profile's CIDs in a single transaction.
+    Profile CIDs not tracked yet are added as 'pending_pin'. Managed ('pinned', 'pending_pin', 'failed_pin')
+    CIDs that are neither in the profile nor in keep_cids are marked 'unpin_requested'.
+    Returns:
+        (number of CIDs added, CIDs marked for unpinning). (0, []) on error.
+    """
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            async with db.execute("SELECT cid FROM pinned_cids WHERE status IN ('pinned', 'pending_pin')") as cursor:
-                rows = await cursor.fetchall()
-                return [row[0] for row in rows]
+        async with _transaction() as db:
+            params = [(cid,) for cid in profile_cids]
+            cursor = await db.executemany(_SQL_INSERT_PENDING, params)
+            added = cursor.rowcount
+            await db.execute(_SQL_CREATE_PROFILE_SNAPSHOT)
+            await db.execute(_SQL_CLEAR_PROFILE_SNAPSHOT)
+            await db.executemany(_SQL_INSERT_PROFILE_SNAPSHOT, params)
+            async with db.execute(_SQL_SELECT_MANAGED_NOT_IN_PROFILE) as cursor:
+                to_unpin = [cid for (cid,) in await cursor.fetchall() if cid not in keep_cids]
+            await db.executemany(_SQL_UPDATE_STATUS, [('unpin_requested', cid) for cid in to_unpin])
+            await db.execute(_SQL_CLEAR_PROFILE_SNAPSHOT)
+        return added, to_unpin
     except aiosqlite.Error as e:
-        logging.error(f"Error fetching all pinned CIDs: {e}")
-        return []
+        logging.error(f"Error syncing pinned CIDs with the profile: {e}")
+        return 0, []
+
+async def diff_pinned_cids(ipfs_cids, include_pending: bool = True) -> tuple[list[str], list[tuple[str, int]]]:
+    """Compares the CIDs pinned on IPFS with those marked 'pinned' or 'pending_pin' in the database, inside SQLite.
+    With include_pending=False, 'pending_pin' CIDs missing from IPFS are left out of the second list
+    (they are still never reported as unwanted on IPFS).
+    Returns:
+        (CIDs pinned on IPFS but not wanted by the database,
+         (cid, retry_count) of CIDs wanted by the database but not pinned on IPFS).
+        Both lists are empty on error, so callers take no action.
+    """
+    try:
+        async with _transaction() as db:
+            await db.execute(_SQL_CREATE_IPFS_SNAPSHOT)
+            await db.execute(_SQL_CLEAR_IPFS_SNAPSHOT)
+            await db.executemany(_SQL_INSERT_IPFS_SNAPSHOT, [(cid,) for cid in ipfs_cids])
+            async with db.execute(_SQL_SELECT_ONLY_IN_IPFS) as cursor:
+                only_in_ipfs = [cid for (cid,) in await cursor.fetchall()]
+            async with db.execute(_SQL_SELECT_ONLY_IN_DB if include_pending else _SQL_SELECT_PINNED_ONLY_IN_DB) as cursor:
+                only_in_db = await cursor.fetchall()
+            await db.execute(_SQL_CLEAR_IPFS_SNAPSHOT)
+        return only_in_ipfs, only_in_db
+    except aiosqlite.Error as e:
+        logging.error(f"Error comparing IPFS pins with the database: {e}")
+        return [], []
 
 async def get_cid_details(cid: str) -> tuple | None:
     """Retrieves details (cid, status, retry_count) for a specific CID from the pinned_cids table."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            async with db.execute("SELECT cid, status, retry_count FROM pinned_cids WHERE cid = ?", (cid,)) as cursor:
-                return await cursor.fetchone()
+        db = await get_db()
+        async with db.execute(_SQL_SELECT_CID_DETAILS, (cid,)) as cursor:
+            return await cursor.fetchone()
     except aiosqlite.Error as e:
         logging.error(f"Error fetching details for CID {cid}: {e}")
         return None
 
+async def remove_cids_from_pinning(cids: list[str]):
+    """Removes several CIDs from the pinned_cids table in a single transaction."""
+    if not cids:
+        return
+    try:
+        async with _transaction() as db:
+            await db.executemany(_SQL_DELETE_CID, [(cid,) for cid in cids])
+        logging.info(f"{len(cids)} CIDs removed from pinning schedule.")
+    except aiosqlite.Error as e:
+        logging.error(f"Error removing {len(cids)} CIDs from pinning: {e}")
+
 async def remove_cid_from_pinning(cid: str):
     """Removes a CID from the pinned_cids table, effectively unpinning it."""
     try:
-        async with aiosqlite.connect(DATABASE_NAME) as db:
-            await db.execute("DELETE FROM pinned_cids WHERE cid = ?", (cid,))
-            await db.commit()
-            logging.info(f"CID {cid} removed from pinning schedule.")
+        async with _transaction() as db:
+            await db.execute(_SQL_DELETE_CID, (cid,))
+        logging.info(f"CID {cid} removed from pinning schedule.")
     except aiosqlite.Error as e:
         logging.error(f"Error removing CID {cid} from pinning: {e}") 
\ No newline at end of file
@@ -1,8 +1,34 @@
 import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import aiohttp
+import orjson
 from substrateinterface import SubstrateInterface
 from substrateinterface.exceptions import SubstrateRequestException
 
+logger = logging.getLogger(__name__)
+
+# add_peers() result statuses and the messages printed for them
+PEER_CONNECTED = 0
+PEER_REMOTE_ERROR = 1
+PEER_TIMEOUT = 2
+PEER_EXCEPTION = 3
+
+PEER_RESULT_MESSAGES = {
+    PEER_CONNECTED: "Successfully connected to peer: {peer_id}",
+    PEER_REMOTE_ERROR: "Failed to connect to peer {peer_id}: {detail}",
+    PEER_TIMEOUT: "Timeout connecting to peer {peer_id}",
+    PEER_EXCEPTION: "Exception connecting to peer {peer_id}: {detail}",
+}
+
+def backoff_delay(attempt, cap=60):
+    """Exponential backoff (1, 2, 4, ... up to cap seconds) with +/-50% jitter."""
+    return min(cap, 2 ** attempt) * random.uniform(0.5, 1.5)
+
 class PeersConnector:
     def __init__(self, ws_url, block_interval=20, batch_size=10, batch_interval=2, connect_timeout=10):
         """
@@ -11,8 +37,8 @@ class PeersConnector:
         Args:
             ws_url (str): WebSocket URL of the Substrate node
             block_interval (int): Number of blocks between queries
-            batch_size (int): Number of peers to process in one batch
-            batch_interval (int): Seconds to wait between batches
+            batch_size (int): Maximum number of concurrent swarm/connect calls
+            batch_interval (int): Base back-off in seconds, scaled by the recent failure rate
             connect_timeout (int): Timeout in seconds for connecting to a peer
         """
         self.ws_url = ws_url
@@ -21,27 +47,103 @@ class PeersConnector:
         self.batch_interval = batch_interval
         self.connect_timeout = connect_timeout
         self.substrate = None
+        # SubstrateInterface isn't thread-safe, so every call to it runs on this one dedicated thread
+        self._rpc_pool = None
+        self._stop_event = threading.Event()  # Ends the block header subscription thread
+        self._job_sema = asyncio.Semaphore(1)  # At most one process_block job in flight
+        self._block_jobs = set()  # Running background process_block tasks
         self.last_processed_block = None
         self.ipfs_api_url = "http://127.0.0.1:5001"
+        self.session = None  # Long-lived aiohttp session to the IPFS API, created in connect()
+        # peer_id -> time.monotonic() of the last successful swarm/connect, oldest first
+        self._peer_cache = OrderedDict()
+        self._peer_ttl = 600  # Seconds before a connected peer is dialed again
+        self._peer_cache_max = 4096
+        # Fingerprint of the last peer set handed to process_peers_in_batches and when that happened
+        self._last_peer_fp = None
+        self._last_peer_refresh = 0.0
+        # Exponentially weighted share of recent swarm/connect calls that failed (0.0 - 1.0)
+        self._fail_ewma = 0.0
+        self._fail_ewma_alpha = 0.2
+        # block number -> block hash, oldest first
+        self._hash_cache = OrderedDict()
+        self._hash_cache_max = 128
 
     async def connect(self):
             """Establish connection to the Substrate node with retries."""
+            attempt = 0
             while True:
                 try:
                     print("Connecting...")
-                    self.substrate = await asyncio.to_thread(SubstrateInterface, url=self.ws_url)
+                    self.substrate = await self._rpc(SubstrateInterface, url=self.ws_url)
                     print(f"Connected to Substrate node at {self.ws_url}")
+                    self._ensure_session()
                     return  # Exit the loop on success
                 except (ConnectionRefusedError, SubstrateRequestException, BrokenPipeError) as e:
                     print(f"Connection attempt failed: {e}")
-                    await asyncio.sleep(5)  # Wait 5 seconds before retrying
                 except Exception as e:
                     print(f"Unexpected error: {e}")
-                    await asyncio.sleep(5)  # Wait 5 seconds before retrying
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
                     
-    async def query_storage_map(self, block_hash, pallet, storage_function):
+    def _get_rpc_pool(self):
+        """Return the single-thread executor used for Substrate RPCs, creating it if needed."""
+        if self._rpc_pool is None:
+            self._rpc_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="substrate")
+        return self._rpc_pool
+
+    async def _rpc(self, fn, *args, **kwargs):
+        """Run a blocking Substrate call on the RPC thread without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_rpc_pool(), lambda: fn(*args, **kwargs)
+        )
+
+    def _cache_block_hash(self, block_number, block_hash):
+        """Remember a block hash, keeping at most _hash_cache_max entries."""
+        self._hash_cache[block_number] = block_hash
+        self._hash_cache.move_to_end(block_number)
+        while len(self._hash_cache) > self._hash_cache_max:
+            self._hash_cache.popitem(last=False)
+
+    async def _block_hash(self, block_number):
+        """Return the hash of a block, querying the node only on a cache miss."""
+        block_hash = self._hash_cache.get(block_number)
+        if block_hash is None:
+            block_hash = await self._rpc(self.substrate.get_block_hash, block_number)
+            if block_hash:
+                self._cache_block_hash(block_number, block_hash)
+        return block_hash
+
+    def _ensure_session(self):
+        """Create the shared IPFS API session if it doesn't exist or was closed."""
+        if self.session is None or self.session.closed:
+            # All requests go to the single local IPFS daemon, so limit_per_host is the effective cap;
+            # it must be >= batch_size or the swarm/connect calls queue inside the connector.
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.batch_size,
+                                             keepalive_timeout=30, force_close=False)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.connect_timeout)
+            )
+
+    async def close(self):
+        """Close the shared IPFS API session and stop the Substrate RPC and subscription threads."""
+        self._stop_event.set()
+        for job in list(self._block_jobs):
+            job.cancel()
+        await asyncio.gather(*self._block_jobs, return_exceptions=True)
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        if self._rpc_pool is not None:
+            self._rpc_pool.shutdown(wait=False)
+            self._rpc_pool = None
+
+    async def query_ipfs_node_ids(self, block_hash, pallet, storage_function):
         """
-        Query a storage map from a pallet at a specific block hash.
+        Query a storage map from a pallet at a specific block hash and extract the IPFS node IDs
+        from its NodeInfo values. Entries are decoded one at a time in the executor thread (including
+        any further page fetches), so only the IDs are kept.
         
         Args:
             block_hash (str): Block hash to query
@@ -49,26 +151,26 @@ class PeersConnector:
             storage_function (str): Storage function name
             
         Returns:
-            list: List of (key, value) tuples with decoded storage data
+            set: IPFS node IDs found in the storage map
         """
-        try:
-            query_result = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.substrate.query_map(
-                    module=pallet,
-                    storage_function=storage_function,
-                    block_hash=block_hash
-                )
+        def collect():
+            query_result = self.substrate.query_map(
+                module=pallet,
+                storage_function=storage_function,
+                block_hash=block_hash
             )
-            result = []
-            for key, value in query_result:
-                key_decoded = key.value  # Vec<u8> as bytes
-                value_decoded = value.value  # NodeInfo as dict
-                result.append((key_decoded, value_decoded))
-            return result
+            ipfs_node_ids = set()
+            for _, value in query_result:
+                node_info = value.value  # NodeInfo as dict
+                if node_info and node_info.get('ipfs_node_id') is not None:
+                    ipfs_node_ids.add(node_info['ipfs_node_id'])
+            return ipfs_node_ids
+
+        try:
+            return await self._rpc(collect)
         except SubstrateRequestException as e:
             print(f"Error querying {pallet}.{storage_function}: {e}")
-            return []
+            return set()
 
     async def add_peers(self, session, peer_id):
         """
@@ -79,42 +181,87 @@ class PeersConnector:
             peer_id (str): The peer ID to connect to
             
         Returns:
-            dict: Response from IPFS API or error message
+            tuple: (status, peer_id, detail) where status is one of the PEER_* constants
+                and detail is the error text, or None
         """
         connect_url = f"{self.ipfs_api_url}/api/v0/swarm/connect"
         params = {"arg": f"/p2p/{peer_id}"}
         try:
-            async with session.post(connect_url, params=params, timeout=self.connect_timeout) as response:
-                result = await response.json()
+            async with session.post(connect_url, params=params) as response:
+                body = await response.read()
+                if response.status != 200:
+                    # Kubo reports a failed dial as HTTP 500 with {"Message": ..., "Code": 0, "Type": "error"}
+                    try:
+                        detail = orjson.loads(body).get("Message")
+                    except (orjson.JSONDecodeError, AttributeError):
+                        detail = None
+                    return (PEER_REMOTE_ERROR, peer_id, detail or f"HTTP {response.status}: {body.decode('utf-8', errors='replace')}")
+                result = orjson.loads(body)
+                if result.get("Type") == "error":
+                    return (PEER_REMOTE_ERROR, peer_id, result.get("Message"))
                 if "error" in result:
-                    return {"error": f"Failed to connect to peer {peer_id}: {result['error']}"}
-                return {"peer_connection": result}
+                    return (PEER_REMOTE_ERROR, peer_id, result['error'])
+                return (PEER_CONNECTED, peer_id, None)
         except asyncio.TimeoutError:
-            return {"error": f"Timeout connecting to peer {peer_id}"}
+            return (PEER_TIMEOUT, peer_id, None)
         except Exception as e:
-            return {"error": f"Exception connecting to peer {peer_id}: {str(e)}"}
+            return (PEER_EXCEPTION, peer_id, str(e))
+
+    def _remember_peer(self, peer_id):
+        """Record a successful connection, evicting the oldest entries beyond _peer_cache_max."""
+        self._peer_cache[peer_id] = time.monotonic()
+        self._peer_cache.move_to_end(peer_id)
+        while len(self._peer_cache) > self._peer_cache_max:
+            self._peer_cache.popitem(last=False)
 
     async def process_peers_in_batches(self, peer_ids):
         """
-        Process peers in batches with a sleep interval between batches.
+        Connect to peers using a pool of batch_size workers pulling from a shared queue,
+        so a slow or timing-out peer only occupies one worker.
         
         Args:
-            peer_ids (list): List of peer IDs to process
+            peer_ids (Collection[str]): Peer IDs to process (any sized iterable, e.g. a set)
         """
-        async with aiohttp.ClientSession() as session:
-            for i in range(0, len(peer_ids), self.batch_size):
-                batch = peer_ids[i:i + self.batch_size]
-                print(f"Processing batch of {len(batch)} peers")
-                tasks = [self.add_peers(session, peer_id) for peer_id in batch]
-                results = await asyncio.gather(*tasks)
-                for result in results:
-                    if "peer_connection" in result:
-                        print(f"Successfully connected to peer: {result['peer_connection']}")
-                    else:
-                        print(result["error"])
-                if i + self.batch_size < len(peer_ids):
-                    print(f"Waiting {self.batch_interval} seconds before next batch")
-                    await asyncio.sleep(self.batch_interval)
+        self._ensure_session()
+        now = time.monotonic()
+        pending_peer_ids = [p for p in peer_ids if now - self._peer_cache.get(p, float('-inf')) > self._peer_ttl]
+        skipped = len(peer_ids) - len(pending_peer_ids)
+        if skipped:
+            print(f"Skipping {skipped} peers connected within the last {self._peer_ttl}s")
+        peer_ids = pending_peer_ids
+
+        queue = asyncio.Queue()
+        for peer_id in peer_ids:
+            queue.put_nowait(peer_id)
+
+        async def worker():
+            while True:
+                peer_id = await queue.get()
+                try:
+                    # Report each result as soon as it arrives rather than after the slowest peer
+                    status, _, detail = await self.add_peers(self.session, peer_id)
+                    failed = status != PEER_CONNECTED
+                    self._fail_ewma += self._fail_ewma_alpha * (failed - self._fail_ewma)
+                    if not failed:
+                        self._remember_peer(peer_id)
+                    print(PEER_RESULT_MESSAGES[status].format(peer_id=peer_id, detail=detail))
+                finally:
+                    queue.task_done()
+                # Back off only while the daemon is failing; healthy runs never sleep
+                if failed:
+                    delay = self.batch_interval * self._fail_ewma * 2
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+        worker_count = min(self.batch_size, len(peer_ids))
+        print(f"Processing {len(peer_ids)} peers with {worker_count} workers")
+        workers = [asyncio.create_task(worker()) for _ in range(worker_count)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
     async def process_block(self, block_number, block_hash):
         """
@@ -126,66 +273,145 @@ class PeersConnector:
         """
         print(f"Processing block {block_number} ({block_hash})")
         
-        # Query ColdkeyNodeRegistration
-        coldkey_nodes = await self.query_storage_map(block_hash, "Registration", "ColdkeyNodeRegistration")
-        print(f"ColdkeyNodeRegistration entries: {len(coldkey_nodes)}")
+        # Query ColdkeyNodeRegistration and NodeRegistration (queued back to back on the RPC thread)
+        coldkey_node_ids, registered_node_ids = await asyncio.gather(
+            self.query_ipfs_node_ids(block_hash, "Registration", "ColdkeyNodeRegistration"),
+            self.query_ipfs_node_ids(block_hash, "Registration", "NodeRegistration")
+        )
+        print(f"ColdkeyNodeRegistration IPFS node IDs: {len(coldkey_node_ids)}")
+        print(f"NodeRegistration IPFS node IDs: {len(registered_node_ids)}")
         
-        # Query NodeRegistration
-        node_registrations = await self.query_storage_map(block_hash, "Registration", "NodeRegistration")
-        print(f"NodeRegistration entries: {len(node_registrations)}")
+        # Merge into one set to remove duplicates
+        ipfs_node_ids = coldkey_node_ids
+        ipfs_node_ids.update(registered_node_ids)
         
-        # Collect all IPFS node IDs into a set to remove duplicates
-        ipfs_node_ids = set()
-        for _, node_info in coldkey_nodes + node_registrations:
-            if node_info and 'ipfs_node_id' in node_info and node_info['ipfs_node_id'] is not None:
-                ipfs_node_id_str = node_info['ipfs_node_id']
-                print("ipfs_node_id_str: ", ipfs_node_id_str)
-                ipfs_node_ids.add(ipfs_node_id_str)
-        
-        # Print the IPFS node IDs and process them in batches
+        # Skip the connect pass when the peer set is unchanged, unless the peer cache TTL has elapsed
+        peer_fp = hash(frozenset(ipfs_node_ids))
+        now = time.monotonic()
+        if peer_fp == self._last_peer_fp and now - self._last_peer_refresh < self._peer_ttl:
+            print(f"IPFS Node IDs unchanged at block {block_number}; skipping peer connections")
+            return
+        self._last_peer_fp = peer_fp
+        self._last_peer_refresh = now
+
+        # Log the IPFS node IDs (one line, only when debug logging is on) and process them in batches
         if ipfs_node_ids:
-            print(f"IPFS Node IDs at block {block_number}:")
-            for idx, node_id in enumerate(ipfs_node_ids, 1):
-                print(f"{idx}. {node_id}")
-            await self.process_peers_in_batches(list(ipfs_node_ids))
+            print(f"{len(ipfs_node_ids)} IPFS Node IDs at block {block_number}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("IPFS Node IDs at block %s: %s", block_number, ", ".join(ipfs_node_ids))
+            await self.process_peers_in_batches(ipfs_node_ids)
         else:
             print("No IPFS Node IDs found")
 
     async def run(self):
         """Main loop to monitor blocks and query storage at intervals."""
+        self._stop_event.clear()
         await self.connect()
+        try:
+            await self._monitor_blocks()
+        finally:
+            await self.close()
+
+    async def _watch_heads(self, heads):
+        """
+        Subscribe to new block headers and push each header into the given queue.
         
-        while True:
+        The subscription blocks its thread for as long as it runs, so it uses its own
+        SubstrateInterface connection on a separate thread rather than the RPC thread.
+        Returns once close() has been called and the next header arrives.
+        
+        Args:
+            heads (asyncio.Queue): Queue receiving header dicts
+        """
+        loop = asyncio.get_running_loop()
+
+        def on_head(block_header, update_nr, subscription_id):
+            if self._stop_event.is_set():
+                return True  # A non-None return value ends the subscription
+            loop.call_soon_threadsafe(heads.put_nowait, block_header['header'])
+
+        def subscribe():
+            substrate = SubstrateInterface(url=self.ws_url)
             try:
-                # Get current block
-                current_block = self.substrate.get_block()
-                current_block_number = current_block['header']['number']
-                current_block_hash = self.substrate.get_block_hash(current_block_number)
-                print("current_block_hash:  ", current_block_hash)
-                # Initialize last_processed_block to the nearest previous interval
-                if self.last_processed_block is None:
-                    self.last_processed_block = current_block_number - (current_block_number % self.block_interval)
-                
-                # Check if it's time to process a new block
-                if current_block_number >= self.last_processed_block + self.block_interval:
-                    target_block = self.last_processed_block + self.block_interval
-                    target_block_hash = self.substrate.get_block_hash(target_block)
-                    
-                    if target_block_hash:
-                        print("processing block....")
-                        await self.process_block(target_block, target_block_hash)
-                        self.last_processed_block = target_block
-                    else:
-                        print(f"Could not get hash for block {target_block}")
-                
-                await asyncio.sleep(6)  # Wait approximately one block time (6 seconds)
-                
+                substrate.subscribe_block_headers(on_head)
+            finally:
+                substrate.close()
+
+        await asyncio.to_thread(subscribe)
+
+    async def _handle_head(self, header):
+        """Process the target block once the head is at least block_interval blocks past the last one."""
+        current_block_number = header['number']
+        current_block_hash = header.get('hash')
+        if current_block_hash:
+            self._cache_block_hash(current_block_number, current_block_hash)
+        print(f"New head: #{current_block_number} ({current_block_hash})")
+        # Initialize last_processed_block to the nearest previous interval
+        if self.last_processed_block is None:
+            self.last_processed_block = current_block_number - (current_block_number % self.block_interval)
+        
+        # Check if it's time to process a new block
+        if current_block_number >= self.last_processed_block + self.block_interval:
+            target_block = self.last_processed_block + self.block_interval
+            target_block_hash = await self._block_hash(target_block)
+            
+            if not target_block_hash:
+                print(f"Could not get hash for block {target_block}")
+            elif self._job_sema.locked():
+                print(f"Still processing a previous block; deferring block {target_block}")
+            else:
+                print("processing block....")
+                # Run in the background so new heads keep being drained while peers are connected
+                job = asyncio.create_task(self._guarded_process(target_block, target_block_hash))
+                self._block_jobs.add(job)
+                job.add_done_callback(self._block_jobs.discard)
+
+    async def _guarded_process(self, block_number, block_hash):
+        """Run process_block under the job semaphore and advance last_processed_block on success."""
+        async with self._job_sema:
+            try:
+                await self.process_block(block_number, block_hash)
+                self.last_processed_block = block_number
             except BrokenPipeError as e:
-                print(f"Broken pipe error in PeersConnector run: {e}. Reconnecting...")
+                print(f"Broken pipe error processing block {block_number}: {e}. Reconnecting...")
                 await self.connect()  # Reconnect to the Substrate node
             except Exception as e:
-                print(f"Error in main loop: {e}")
-                await asyncio.sleep(10)  # Wait before retrying
+                print(f"Error processing block {block_number}: {e}")
+
+    async def _monitor_blocks(self):
+        """Follow new block headers pushed by the node and process every block_interval-th block."""
+        failures = 0  # Consecutive errors, for backoff
+        while True:
+            heads = asyncio.Queue()
+            watcher = asyncio.create_task(self._watch_heads(heads))
+            try:
+                while True:
+                    next_head = asyncio.create_task(heads.get())
+                    await asyncio.wait({next_head, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_head.done():
+                        next_head.cancel()
+                        break  # Subscription thread exited
+                    try:
+                        await self._handle_head(next_head.result())
+                        failures = 0
+                    except BrokenPipeError as e:
+                        print(f"Broken pipe error in PeersConnector run: {e}. Reconnecting...")
+                        await self.connect()  # Reconnect to the Substrate node
+                    except Exception as e:
+                        print(f"Error in main loop: {e}")
+                        await asyncio.sleep(backoff_delay(failures))  # Wait before retrying
+                        failures += 1
+
+                try:
+                    watcher.result()
+                    print("Block header subscription ended. Resubscribing...")
+                except Exception as e:
+                    print(f"Block header subscription failed: {e}. Resubscribing...")
+                await asyncio.sleep(backoff_delay(failures))  # Wait before resubscribing
+                failures += 1
+            finally:
+                if not watcher.done():
+                    watcher.cancel()
 
 async def main():
     """Entry point for the application."""
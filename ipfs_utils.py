@@ -1,27 +1,130 @@
 # Utilities for IPFS operations using aiohttp
 import asyncio
+import atexit
 import aiohttp # Changed from ipfshttpclient
 import json # Already imported in previous version for get_json_from_cid
 import logging
+import orjson # Faster decoding for CID content and GC events
 import os
-from config_manager import IPFS_API_HOST, IPFS_API_PORT
+import time
+from collections import OrderedDict
+from config_manager import IPFS_API_HOST, IPFS_API_PORT, IPFS_API_SOCKET, PIN_BATCH_MAX_SIZE, PIN_BATCH_MAX_DELAY_MS
 
 # Construct the base URL for IPFS API calls
 IPFS_API_BASE_URL = f"http://{IPFS_API_HOST}:{IPFS_API_PORT}/api/v0"
+_URL_ID = f"{IPFS_API_BASE_URL}/id"
+_URL_PIN_ADD = f"{IPFS_API_BASE_URL}/pin/add"
+_URL_PIN_RM = f"{IPFS_API_BASE_URL}/pin/rm"
+_URL_PIN_LS = f"{IPFS_API_BASE_URL}/pin/ls"
+_URL_CAT = f"{IPFS_API_BASE_URL}/cat"
+_URL_REPO_GC = f"{IPFS_API_BASE_URL}/repo/gc"
+
+# Fixed query parameters, as tuples of (key, value) pairs that aiohttp accepts directly
+_PIN_ADD_PARAMS = (('recursive', 'true'), ('progress', 'false'))
+_PIN_RM_PARAMS = (('recursive', 'true'),)
+_PIN_LS_RECURSIVE_PARAMS = (('type', 'recursive'),) # type=recursive is important to list all items that keep data locally
+
+# A Unix socket skips TCP entirely, but only makes sense when the daemon runs on this machine
+_LOCAL_HOSTS = frozenset({'127.0.0.1', 'localhost', '::1'})
+
+# All calls go to the same local daemon, so one session keeps its connections alive between requests.
+# The Kubo RPC API speaks plain HTTP/1.1 (no h2c), so concurrent calls use a pool of kept-alive
+# connections rather than HTTP/2 streams over one socket.
+_session: aiohttp.ClientSession | None = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Returns the module-wide ClientSession, creating it on first use.
+    Timeouts are passed per request, since the API calls use different limits.
+    """
+    global _session
+    if _session is None or _session.closed:
+        if IPFS_API_SOCKET and IPFS_API_HOST in _LOCAL_HOSTS:
+            # Requests keep their http://host:port URLs; only the transport changes
+            logging.info(f"Connecting to the IPFS API over Unix socket {IPFS_API_SOCKET}")
+            connector = aiohttp.UnixConnector(path=IPFS_API_SOCKET, limit=0, limit_per_host=32,
+                                              keepalive_timeout=75, force_close=False)
+        else:
+            # Only one host is ever contacted, so limit_per_host is the effective cap. DNS answers are kept
+            # for five minutes, and idle connections stay open between bursts of requests.
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=32, ttl_dns_cache=300, use_dns_cache=True,
+                                             keepalive_timeout=75, force_close=False)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def aclose():
+    """Stops the pin/unpin batchers and closes the shared ClientSession, if one was opened.
+    Long-running callers should await this during graceful shutdown; the atexit hook below is only a fallback.
+    """
+    global _session
+    await _pin_batcher.stop()
+    await _unpin_batcher.stop()
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+def _close_session_at_exit():
+    """Best-effort close of a session the process forgot to aclose(), to avoid 'Unclosed client session' warnings."""
+    if _session is None or _session.closed:
+        return
+    try:
+        asyncio.run(_session.close())
+    except Exception as e: # The session's original event loop is usually gone by now
+        logging.debug(f"Could not close the IPFS API session at exit: {e}")
+
+atexit.register(_close_session_at_exit)
+
+# ClientTimeout objects for the timeouts the helpers below use by default, built once
+_TIMEOUTS = {seconds: aiohttp.ClientTimeout(total=seconds) for seconds in (10, 30, 60, 300)}
+
+def _get_timeout(timeout_seconds: int) -> aiohttp.ClientTimeout:
+    """Returns a total-time ClientTimeout, reusing a prebuilt one for the common values."""
+    return _TIMEOUTS.get(timeout_seconds) or aiohttp.ClientTimeout(total=timeout_seconds)
+
+# Lowercase fragments of IPFS error messages that mean the request is effectively already satisfied.
+# Longer variants such as "is not pinned" / "path is not pinned" are covered by "not pinned".
+_ALREADY_PINNED_PATTERNS = ("already pinned",)
+_NOT_PINNED_PATTERNS = ("not pinned", "no pin for")
+# ...and fragments meaning /cat could not find the CID's blocks
+_CID_UNAVAILABLE_PATTERNS = ("not found", "failed to get block")
+
+def _message_matches(message, patterns: tuple[str, ...]) -> bool:
+    """True if the lowercased message contains any of the given lowercase fragments."""
+    message = str(message).lower()
+    return any(pattern in message for pattern in patterns)
+
+# Connection-level failures (refused, reset or dropped connections) are worth retrying.
+# IPFS reports real errors (not found, not pinned, ...) as HTTP 500, and a total timeout means the daemon
+# was busy with the request, so neither is retried.
+_RETRY_ATTEMPTS = 3
+_RETRY_BASE_DELAY_SECONDS = 0.3
+
+async def _with_retry(coro_factory, attempts: int = _RETRY_ATTEMPTS, base_delay: float = _RETRY_BASE_DELAY_SECONDS):
+    """Awaits coro_factory(), calling it again with exponential backoff if the connection to the daemon fails.
+    Only use this for idempotent API calls. The last error is re-raised once all attempts are used.
+    """
+    for attempt in range(attempts):
+        try:
+            return await coro_factory()
+        except aiohttp.ClientConnectionError as e:
+            if attempt == attempts - 1:
+                raise
+            delay = base_delay * 2 ** attempt
+            logging.warning(f"IPFS API connection error: {e}. Retrying in {delay:.1f}s (attempt {attempt + 2}/{attempts}).")
+            await asyncio.sleep(delay)
 
 async def get_ipfs_id() -> dict | None:
     """Fetches the IPFS node's ID and other information.
     Equivalent to `ipfs id` command.
     """
-    url = f"{IPFS_API_BASE_URL}/id"
+    url = _URL_ID
     logging.debug(f"Fetching IPFS ID from: {url}")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url) as response: # IPFS /id endpoint often uses POST
-                response.raise_for_status() # Raise an exception for HTTP error codes
-                data = await response.json()
-                logging.debug(f"Successfully fetched IPFS ID: {data.get('ID')}")
-                return data
+        session = await get_session()
+        async with session.post(url) as response: # IPFS /id endpoint often uses POST
+            response.raise_for_status() # Raise an exception for HTTP error codes
+            data = await response.json()
+            logging.debug(f"Successfully fetched IPFS ID: {data.get('ID')}")
+            return data
     except aiohttp.ClientResponseError as e:
         logging.error(f"HTTP error while fetching IPFS ID: {e.status} {e.message}")
         # Try to get more details from response if it's an IPFS error JSON
@@ -38,97 +141,299 @@ async def get_ipfs_id() -> dict | None:
         logging.error(f"Unexpected error fetching IPFS ID: {e}", exc_info=True)
     return None
 
-async def pin_cid(cid: str, timeout_seconds: int = 60) -> bool:
-    """Pins a CID to the local IPFS node using aiohttp.
-    Args:
-        cid: The CID string to pin.
-        timeout_seconds: Timeout for the API call.
+async def _post_pin_request(url: str, cids: list[str], extra_params: tuple, action: str, benign_patterns: tuple[str, ...], benign_log: str, timeout_seconds: int) -> bool | None:
+    """Sends one /pin/add or /pin/rm request carrying every CID in `cids` as a repeated 'arg' parameter.
+    The daemon aborts the whole request on the first failing CID, so an error only tells us about
+    the batch as a whole; an error whose message matches `benign_patterns` counts as success for a single CID.
     Returns:
-        True if pinning was successful or CID was already pinned, False otherwise.
+        True if the request succeeded, False otherwise, or None if a batch of several CIDs stopped at a
+        benign error (some CID was already pinned / not pinned, and the rest were not processed).
     """
-    url = f"{IPFS_API_BASE_URL}/pin/add"
-    params = {'arg': cid, 'recursive': 'true', 'progress': 'false'}
-    logging.info(f"Attempting to pin CID: {cid} via {url}")
-    
+    target = f"CID {cids[0]}" if len(cids) == 1 else f"{len(cids)} CIDs"
+    params = [('arg', cid) for cid in cids]
+    params += extra_params
+    logging.info(f"Attempting to {action} {target} via {url}")
+
     try:
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, params=params) as response:
+        timeout = _get_timeout(timeout_seconds)
+        async def _attempt():
+            session = await get_session()
+            async with session.post(url, params=params, timeout=timeout) as response:
                 if response.status == 200:
-                    # Successful pin usually returns a list of pins added, e.g. {"Pins": ["<cid>"]}
-                    # Or if already pinned, it might also return 200 OK with the CID.
-                    # We'll check if the response indicates success.
-                    data = await response.json()
-                    logging.info(f"Successfully pinned CID: {cid}. Response: {data}")
-                    # Ensure the pinned CID is in the response if structure is known
-                    # For now, status 200 is treated as success for pinning.
+                    # The body only echoes the affected CIDs ({"Pins": [...]}); read it so the connection
+                    # can be reused, but don't decode it unless it will be logged
+                    body = await response.read()
+                    logging.info(f"Successfully {action}ned {target}.")
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        logging.debug(f"Response for {action} of {target}: {body.decode('utf-8', errors='replace')}")
                     return True
                 else:
                     # Check for IPFS-specific error messages in JSON response
                     error_text = await response.text()
                     try:
                         error_json = json.loads(error_text)
-                        if "Message" in error_json and "already pinned" in error_json["Message"].lower():
-                            logging.info(f"CID {cid} is already pinned.")
-                            return True
-                        logging.error(f"IPFS API error while pinning {cid} (Status {response.status}): {error_json}")
+                        if _message_matches(error_json.get("Message", ""), benign_patterns):
+                            if len(cids) == 1:
+                                logging.info(benign_log.format(cid=cids[0]))
+                                return True
+                            logging.info(f"Batch {action} of {target} stopped at a benign error: {error_json.get('Message')}")
+                            return None
+                        logging.error(f"IPFS API error while {action}ning {target} (Status {response.status}): {error_json}")
                     except json.JSONDecodeError:
-                        logging.error(f"Non-JSON error response while pinning {cid} (Status {response.status}): {error_text}")
+                        logging.error(f"Non-JSON error response while {action}ning {target} (Status {response.status}): {error_text}")
                     return False
+        return await _with_retry(_attempt)
     except aiohttp.ClientResponseError as e:
-        logging.error(f"HTTP error while pinning {cid}: Status {e.status}, Message {e.message}")
+        logging.error(f"HTTP error while {action}ning {target}: Status {e.status}, Message {e.message}")
     except aiohttp.ClientConnectionError as e:
-        logging.error(f"Connection error while pinning CID {cid}: {e}")
+        logging.error(f"Connection error while {action}ning {target}: {e}")
     except asyncio.TimeoutError:
-        logging.error(f"Timeout while pinning CID {cid} after {timeout_seconds}s.")
+        logging.error(f"Timeout while {action}ning {target} after {timeout_seconds}s.")
     except Exception as e:
-        logging.error(f"Unexpected error while pinning CID {cid}: {e}", exc_info=True)
+        logging.error(f"Unexpected error while {action}ning {target}: {e}", exc_info=True)
     return False
 
+# A multi-CID request's timeout grows by this much per CID beyond the first, up to this multiple of the per-CID timeout
+_BATCH_TIMEOUT_PER_EXTRA_CID_SECONDS = 2
+_BATCH_TIMEOUT_MAX_FACTOR = 4
+
+def _batch_timeout(timeout_seconds: int, cid_count: int) -> int:
+    """Timeout for one request carrying cid_count CIDs; the daemon handles a request's CIDs in turn."""
+    return min(timeout_seconds + _BATCH_TIMEOUT_PER_EXTRA_CID_SECONDS * (cid_count - 1),
+               timeout_seconds * _BATCH_TIMEOUT_MAX_FACTOR)
+
+async def _run_pin_batches(url: str, cids: list[str], extra_params: tuple, action: str, benign_patterns: tuple[str, ...], benign_log: str, batch_size: int, timeout_seconds: int) -> dict[str, bool]:
+    """Splits `cids` into batches of `batch_size` and sends one request per batch.
+    A failed batch is retried one CID per request, concurrently, so a single bad CID does not fail its
+    neighbours and the retries take about one request's time rather than one per CID.
+    `timeout_seconds` is the per-CID budget: one-CID requests get exactly that, larger batches a scaled-up one.
+    """
+    async def _single(cid):
+        return await _post_pin_request(url, [cid], extra_params, action, benign_patterns, benign_log, timeout_seconds)
+
+    results = {}
+    for start in range(0, len(cids), batch_size):
+        batch = cids[start:start + batch_size]
+        outcome = await _post_pin_request(url, batch, extra_params, action, benign_patterns, benign_log,
+                                          _batch_timeout(timeout_seconds, len(batch)))
+        if outcome:
+            results.update(dict.fromkeys(batch, True))
+        elif len(batch) > 1:
+            if outcome is None: # Benign for some CID; the rest just need sending on their own
+                logging.info(f"Sending the {len(batch)} CIDs of the {action} batch one per request.")
+            else:
+                logging.warning(f"Batch {action} of {len(batch)} CIDs failed. Retrying them one per request.")
+            singles = await _gather_limited(_single, batch, DEFAULT_CONCURRENCY)
+            results.update((cid, ok is True) for cid, ok in zip(batch, singles))
+        else:
+            results[batch[0]] = False
+    return results
+
+async def pin_cids(cids: list[str], batch_size: int = 64, timeout_seconds: int = 60) -> dict[str, bool]:
+    """Pins several CIDs to the local IPFS node, sending up to `batch_size` CIDs per /pin/add call.
+    Args:
+        cids: The CID strings to pin.
+        batch_size: Maximum number of CIDs per request.
+        timeout_seconds: Timeout for a single-CID API call; requests carrying more CIDs get proportionally longer.
+    Returns:
+        A dict mapping each CID to True if it was pinned (or already pinned), False otherwise.
+    """
+    results = await _run_pin_batches(_URL_PIN_ADD, list(cids), _PIN_ADD_PARAMS,
+                                     "pin", _ALREADY_PINNED_PATTERNS, "CID {cid} is already pinned.", batch_size, timeout_seconds)
+    _record_pin_changes(results, pinned=True)
+    return results
+
+async def unpin_cids(cids: list[str], batch_size: int = 64, timeout_seconds: int = 60) -> dict[str, bool]:
+    """Unpins several CIDs from the local IPFS node, sending up to `batch_size` CIDs per /pin/rm call.
+    Args:
+        cids: The CID strings to unpin.
+        batch_size: Maximum number of CIDs per request.
+        timeout_seconds: Timeout for a single-CID API call; requests carrying more CIDs get proportionally longer.
+    Returns:
+        A dict mapping each CID to True if it was unpinned (or was not pinned), False otherwise.
+    """
+    results = await _run_pin_batches(_URL_PIN_RM, list(cids), _PIN_RM_PARAMS,
+                                     "unpin", _NOT_PINNED_PATTERNS, "CID {cid} was not pinned or already unpinned.", batch_size, timeout_seconds)
+    _record_pin_changes(results, pinned=False)
+    return results
+
+class _PinBatcher:
+    """Coalesces single-CID pin or unpin requests that arrive close together into one batched call.
+    A batch is sent once it holds `max_batch` CIDs or `max_delay_ms` has passed since its first CID arrived.
+    Each batch is sent from its own task (at most `max_in_flight` at once), so a slow batch, e.g. one
+    waiting on an unavailable CID, doesn't hold up the requests queued behind it.
+    """
+    def __init__(self, batch_fn, max_batch: int, max_delay_ms: int, max_in_flight: int = 4):
+        self._batch_fn = batch_fn # pin_cids or unpin_cids
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0, max_delay_ms) / 1000
+        self._slots = asyncio.Semaphore(max(1, max_in_flight))
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def submit(self, cid: str, timeout_seconds: int) -> bool:
+        """Queues a CID for the next batch and waits for its result."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((cid, timeout_seconds, future))
+        return await future
+
+    async def stop(self):
+        """Stops the background task and the batches it has sent; requests still queued are cancelled."""
+        tasks = list(self._in_flight)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _collect(self) -> list[tuple]:
+        """Waits for the first request, then gathers more until the batch is full or the delay runs out."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, batch: list[tuple]):
+        """Sends one collected batch and hands each caller its CID's result."""
+        try:
+            async with self._slots:
+                cids = list(dict.fromkeys(cid for cid, _, _ in batch)) # Same CID may be requested twice
+                # The callers' timeouts are per CID; pin_cids/unpin_cids scale them up for multi-CID requests
+                timeout_seconds = max(timeout for _, timeout, _ in batch)
+                try:
+                    results = await self._batch_fn(cids, batch_size=self.max_batch, timeout_seconds=timeout_seconds)
+                except Exception as e:
+                    logging.error(f"Unexpected error processing batch of {len(cids)} CIDs: {e}", exc_info=True)
+                    results = {}
+                for cid, _, future in batch:
+                    if not future.done(): # The caller may have been cancelled while waiting
+                        future.set_result(results.get(cid, False))
+        finally:
+            # Don't leave callers waiting forever if the batch was cancelled before it finished
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _run(self):
+        try:
+            while True:
+                batch = await self._collect()
+                task = asyncio.create_task(self._send(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+        finally:
+            # Don't leave callers waiting forever on requests that will never be sent
+            while not self._queue.empty():
+                self._queue.get_nowait()[2].cancel()
+
+_pin_batcher = _PinBatcher(pin_cids, PIN_BATCH_MAX_SIZE, PIN_BATCH_MAX_DELAY_MS)
+_unpin_batcher = _PinBatcher(unpin_cids, PIN_BATCH_MAX_SIZE, PIN_BATCH_MAX_DELAY_MS)
+
+async def pin_cid(cid: str, timeout_seconds: int = 60) -> bool:
+    """Pins a CID to the local IPFS node using aiohttp.
+    Concurrent calls are batched into a single /pin/add request (see _PinBatcher).
+    Args:
+        cid: The CID string to pin.
+        timeout_seconds: Timeout for the API call.
+    Returns:
+        True if pinning was successful or CID was already pinned, False otherwise.
+    """
+    return await _pin_batcher.submit(cid, timeout_seconds)
+
 async def unpin_cid(cid: str, timeout_seconds: int = 60) -> bool:
     """Unpins a CID from the local IPFS node using aiohttp.
+    Concurrent calls are batched into a single /pin/rm request (see _PinBatcher).
     Args:
         cid: The CID string to unpin.
         timeout_seconds: Timeout for the API call.
     Returns:
         True if unpinning was successful or CID was not pinned, False otherwise.
     """
-    url = f"{IPFS_API_BASE_URL}/pin/rm"
-    params = {'arg': cid, 'recursive': 'true'}
-    logging.info(f"Attempting to unpin CID: {cid} via {url}")
-    
-    try:
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    logging.info(f"Successfully unpinned CID: {cid}. Response: {data}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    try:
-                        error_json = json.loads(error_text)
-                        # Common error messages for "not pinned"
-                        msg = error_json.get("Message", "").lower()
-                        if "not pinned" in msg or "is not pinned" in msg:
-                            logging.info(f"CID {cid} was not pinned or already unpinned.")
-                            return True
-                        logging.error(f"IPFS API error while unpinning {cid} (Status {response.status}): {error_json}")
-                    except json.JSONDecodeError:
-                        logging.error(f"Non-JSON error response while unpinning {cid} (Status {response.status}): {error_text}")
-                    return False
-    except aiohttp.ClientResponseError as e:
-        logging.error(f"HTTP error while unpinning {cid}: Status {e.status}, Message {e.message}")
-    except aiohttp.ClientConnectionError as e:
-        logging.error(f"Connection error while unpinning CID {cid}: {e}")
-    except asyncio.TimeoutError:
-        logging.error(f"Timeout while unpinning CID {cid} after {timeout_seconds}s.")
-    except Exception as e:
-        logging.error(f"Unexpected error while unpinning CID {cid}: {e}", exc_info=True)
-    return False
+    return await _unpin_batcher.submit(cid, timeout_seconds)
+
+# Recently seen pin states, so repeated checks of the same CID (e.g. in retry loops) skip the API call
+_PIN_CACHE_TTL_SECONDS = 5.0
+_PIN_CACHE_MAX_SIZE = 4096
+_pin_cache: OrderedDict[str, tuple[bool, float]] = OrderedDict() # cid -> (pinned, expiry), oldest first
+_pinned_list_cache: tuple[list[str], frozenset[str], float] | None = None # Last list_pinned_cids() result and its expiry
+_pin_generation = 0 # Bumped on every pin change, so a listing that raced with one is not cached
+
+def _fresh_pinned_list_cache() -> tuple[list[str], frozenset[str], float] | None:
+    """Returns the cached pin listing if it has not expired yet."""
+    if _pinned_list_cache is not None and _pinned_list_cache[2] > time.monotonic():
+        return _pinned_list_cache
+    return None
+
+def _get_cached_pin_status(cid: str) -> bool | None:
+    """Returns the cached pin state of a CID, or None if it is unknown or expired."""
+    now = time.monotonic()
+    entry = _pin_cache.get(cid)
+    if entry is not None:
+        pinned, expiry = entry
+        if expiry > now:
+            _pin_cache.move_to_end(cid)
+            return pinned
+        del _pin_cache[cid]
+    # A fresh recursive pin listing can confirm a pin, but not rule one out (the CID may be pinned directly)
+    listing = _fresh_pinned_list_cache()
+    if listing is not None and cid in listing[1]:
+        return True
+    return None
+
+def _cache_pin_status(cid: str, pinned: bool):
+    """Records a CID's pin state, evicting the least recently used entries past _PIN_CACHE_MAX_SIZE."""
+    _pin_cache[cid] = (pinned, time.monotonic() + _PIN_CACHE_TTL_SECONDS)
+    _pin_cache.move_to_end(cid)
+    while len(_pin_cache) > _PIN_CACHE_MAX_SIZE:
+        _pin_cache.popitem(last=False)
+
+def _record_pin_changes(results: dict[str, bool], pinned: bool):
+    """Updates the caches after a pin (pinned=True) or unpin (pinned=False) request."""
+    global _pinned_list_cache, _pin_generation
+    changed = False
+    for cid, ok in results.items():
+        if ok:
+            _cache_pin_status(cid, pinned)
+            changed = True
+    if changed:
+        _pinned_list_cache = None
+        _pin_generation += 1
 
 async def is_cid_pinned(cid: str, timeout_seconds: int = 10) -> bool:
+    """Checks if a CID is pinned locally, answering from a short-lived cache when possible.
+    Args:
+        cid: The CID string to check.
+        timeout_seconds: Timeout for the API call.
+    Returns:
+        True if the CID is pinned, False otherwise.
+    """
+    pinned = _get_cached_pin_status(cid)
+    if pinned is not None:
+        logging.debug(f"CID {cid} pin status served from cache: {pinned}")
+        return pinned
+    pinned = await _query_pin_status(cid, timeout_seconds)
+    if pinned is None:
+        return False # Errors are not cached; assume not pinned
+    _cache_pin_status(cid, pinned)
+    return pinned
+
+async def _query_pin_status(cid: str, timeout_seconds: int) -> bool | None:
     """Checks if a CID is pinned locally using aiohttp.
     The /api/v0/pin/ls?arg=<cid> endpoint returns a list of matching pins.
     If the CID is pinned, it will be in the 'Keys' of the response.
@@ -139,18 +444,19 @@ async def is_cid_pinned(cid: str, timeout_seconds: int = 10) -> bool:
         cid: The CID string to check.
         timeout_seconds: Timeout for the API call.
     Returns:
-        True if the CID is pinned, False otherwise.
+        True if the CID is pinned, False if it is not, None if the status could not be determined.
     """
-    url = f"{IPFS_API_BASE_URL}/pin/ls"
+    url = _URL_PIN_LS
     # For a specific CID, type=recursive is usually implied or a good default to check.
     # Some versions of IPFS might be strict about the types: 'direct', 'indirect', 'recursive', 'all'
-    params = {'arg': cid, 'type': 'all'} # Check all pin types for this CID
+    params = (('arg', cid), ('type', 'all')) # Check all pin types for this CID
     logging.debug(f"Checking if CID {cid} is pinned via {url}")
     
     try:
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, params=params) as response:
+        timeout = _get_timeout(timeout_seconds)
+        async def _attempt():
+            session = await get_session()
+            async with session.post(url, params=params, timeout=timeout) as response:
                 if response.status == 200:
                     data = await response.json()
                     # Successful response for a pinned CID typically looks like:
@@ -168,14 +474,14 @@ async def is_cid_pinned(cid: str, timeout_seconds: int = 10) -> bool:
                     error_text = await response.text()
                     try:
                         error_json = json.loads(error_text)
-                        msg = error_json.get("Message", "").lower()
-                        if "not pinned" in msg or "no pin for" in msg or "path is not pinned" in msg:
+                        if _message_matches(error_json.get("Message", ""), _NOT_PINNED_PATTERNS):
                             logging.debug(f"CID {cid} is not pinned (API error message). Error: {error_json}")
                             return False
                         logging.warning(f"IPFS API error checking pin status for {cid} (Status {response.status}): {error_json}")
                     except json.JSONDecodeError:
                         logging.warning(f"Non-JSON error response checking pin status for {cid} (Status {response.status}): {error_text}")
-                    return False # Assume not pinned if error or unexpected 200 response structure
+                    return None # Status unknown after an unexpected error response
+        return await _with_retry(_attempt)
 
     except aiohttp.ClientResponseError as e:
         # A ClientResponseError (like 500) with "not pinned" message is a common way IPFS signals not pinned.
@@ -183,8 +489,7 @@ async def is_cid_pinned(cid: str, timeout_seconds: int = 10) -> bool:
         try:
             error_text_body = await e.response.text() # type: ignore
             error_json = json.loads(error_text_body)
-            msg = error_json.get("Message", "").lower()
-            if "not pinned" in msg or "no pin for" in msg or "path is not pinned" in msg:
+            if _message_matches(error_json.get("Message", ""), _NOT_PINNED_PATTERNS):
                 logging.debug(f"CID {cid} is not pinned (HTTP {e.status} with specific message). Error: {error_json}")
                 return False
         except Exception:
@@ -196,34 +501,66 @@ async def is_cid_pinned(cid: str, timeout_seconds: int = 10) -> bool:
         logging.error(f"Timeout while checking pin status for CID {cid} after {timeout_seconds}s.")
     except Exception as e:
         logging.error(f"Unexpected error checking pin status for CID {cid}: {e}", exc_info=True)
-    return False # Default to false on errors
+    return None # Status unknown on errors
+
+# Default ceiling for concurrent IPFS calls; every extra in-flight pin multiplies the daemon's DHT work
+DEFAULT_CONCURRENCY = 16
+
+async def _gather_limited(func, cids, concurrency: int) -> list:
+    """Runs func(cid) for every CID concurrently, with at most `concurrency` calls in flight.
+    Results are returned in the order of `cids`; exceptions are returned in place of results.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(cid):
+        async with sem:
+            return await func(cid)
+
+    return await asyncio.gather(*(_one(cid) for cid in cids), return_exceptions=True)
+
+async def pin_many(cids, concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """Pins several CIDs concurrently. Returns pin_cid's result (or the raised exception) for each CID, in order."""
+    return await _gather_limited(pin_cid, cids, concurrency)
+
+async def unpin_many(cids, concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """Unpins several CIDs concurrently. Returns unpin_cid's result (or the raised exception) for each CID, in order."""
+    return await _gather_limited(unpin_cid, cids, concurrency)
 
 async def list_pinned_cids(timeout_seconds: int = 30) -> list[str]:
     """Lists all CIDs pinned (recursively) on the local IPFS node using aiohttp.
+    The result is cached for a few seconds and dropped whenever a pin or unpin succeeds.
     Returns:
         A list of pinned CID strings. Returns an empty list on error.
     """
-    url = f"{IPFS_API_BASE_URL}/pin/ls"
-    # type=recursive is important to list all items that keep data locally
-    params = {'type': 'recursive'} 
+    global _pinned_list_cache
+    listing = _fresh_pinned_list_cache()
+    if listing is not None:
+        logging.debug(f"Serving {len(listing[0])} recursively pinned CIDs from cache.")
+        return list(listing[0])
+    generation = _pin_generation
+
+    url = _URL_PIN_LS
+    params = _PIN_LS_RECURSIVE_PARAMS
     logging.debug(f"Listing all recursively pinned CIDs from {url}")
 
     try:
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, params=params) as response: # pin/ls often uses POST
-                response.raise_for_status()
-                data = await response.json()
-                if "Keys" in data and isinstance(data["Keys"], dict):
-                    pinned_list = list(data["Keys"].keys())
-                    logging.debug(f"Found {len(pinned_list)} recursively pinned CIDs.")
-                    return pinned_list
-                elif not data: # Handles empty JSON object {} case for no pins
-                    logging.debug("pin/ls response is empty, indicating no pins.")
-                    return []
-                else:
-                    logging.warning(f"Unexpected structure in pin/ls response (expected 'Keys' dict or empty dict): {data}")
-                    return []
+        timeout = _get_timeout(timeout_seconds)
+        session = await get_session()
+        async with session.post(url, params=params, timeout=timeout) as response: # pin/ls often uses POST
+            response.raise_for_status()
+            data = await response.json()
+            if "Keys" in data and isinstance(data["Keys"], dict):
+                pinned_list = list(data["Keys"].keys())
+                logging.debug(f"Found {len(pinned_list)} recursively pinned CIDs.")
+                if generation == _pin_generation:
+                    _pinned_list_cache = (pinned_list, frozenset(pinned_list), time.monotonic() + _PIN_CACHE_TTL_SECONDS)
+                return list(pinned_list)
+            elif not data: # Handles empty JSON object {} case for no pins
+                logging.debug("pin/ls response is empty, indicating no pins.")
+                return []
+            else:
+                logging.warning(f"Unexpected structure in pin/ls response (expected 'Keys' dict or empty dict): {data}")
+                return []
     except aiohttp.ClientResponseError as e:
         logging.error(f"HTTP error while listing pinned CIDs: {e.status} {e.message}")
     except aiohttp.ClientConnectionError as e:
@@ -234,6 +571,46 @@ async def list_pinned_cids(timeout_seconds: int = 30) -> list[str]:
         logging.error(f"Unexpected error while listing pinned CIDs: {e}", exc_info=True)
     return []
 
+async def get_pinned_set(timeout_seconds: int = 30) -> frozenset[str]:
+    """Returns the set of recursively pinned CIDs, sharing list_pinned_cids' short-lived cache.
+    Returns:
+        A frozenset of pinned CID strings. Returns an empty set on error.
+    """
+    listing = _fresh_pinned_list_cache()
+    if listing is None:
+        pinned_list = await list_pinned_cids(timeout_seconds)
+        listing = _fresh_pinned_list_cache()
+        if listing is None: # Not cached (error, or a pin changed meanwhile)
+            return frozenset(pinned_list)
+    return listing[1]
+
+async def are_cids_pinned(cids, timeout_seconds: int = 30) -> dict[str, bool]:
+    """Checks the pin status of several CIDs with a single /pin/ls call.
+    This is the preferred way to check many CIDs at once; use is_cid_pinned for one-off checks.
+    Only recursive pins are considered, which is how this service pins everything.
+    Returns:
+        A dict mapping each CID to True if it is recursively pinned, False otherwise (including on errors).
+    """
+    pinned = await get_pinned_set(timeout_seconds)
+    return {cid: cid in pinned for cid in cids}
+
+# Bodies up to this size with a known Content-Length are read in one go
+_FAST_PATH_MAX_BYTES = 64 * 1024
+
+async def _read_limited(response: aiohttp.ClientResponse, cid: str, max_size_bytes: int) -> bytearray | None:
+    """Streams a response body, giving up once it grows past max_size_bytes.
+    Returns:
+        The body, or None if it was too large.
+    """
+    content_bytes = bytearray() # Grows in place, unlike repeated bytes concatenation
+    async for chunk in response.content.iter_chunked(65536): # Read in 64KB chunks
+        if len(content_bytes) + len(chunk) > max_size_bytes:
+            logging.error(f"Content from CID {cid} exceeds max size of {max_size_bytes} bytes. Aborting download.")
+            response.close() # Drop the connection rather than draining the rest of an oversized body
+            return None
+        content_bytes.extend(chunk)
+    return content_bytes
+
 async def get_json_from_cid(cid: str, timeout_seconds: int = 30, max_size_bytes: int = 2 * 1024 * 1024) -> dict | list | None:
     """Fetches content from an IPFS CID and parses it as JSON using aiohttp.
     Args:
@@ -243,44 +620,46 @@ async def get_json_from_cid(cid: str, timeout_seconds: int = 30, max_size_bytes:
     Returns:
         A dictionary or list if JSON parsing is successful, None otherwise.
     """
-    url = f"{IPFS_API_BASE_URL}/cat"
-    params = {'arg': cid}
+    url = _URL_CAT
+    params = (('arg', cid),)
     logging.debug(f"Attempting to fetch and parse JSON from CID: {cid} via {url}")
 
     try:
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, params=params) as response: # cat uses POST
+        timeout = _get_timeout(timeout_seconds)
+        async def _attempt():
+            session = await get_session()
+            async with session.post(url, params=params, timeout=timeout) as response: # cat uses POST
                 response.raise_for_status() # Will raise for 4xx/5xx errors
-                
-                content_bytes = b''
-                current_size = 0
-                # Manually stream the response to check size
-                async for chunk in response.content.iter_chunked(1024): # Read in 1KB chunks
-                    current_size += len(chunk)
-                    if current_size > max_size_bytes:
-                        logging.error(f"Content from CID {cid} exceeds max size of {max_size_bytes} bytes. Aborting download.")
-                        await response.release() # Important to release connection resources
+
+                # Reject oversized content up front when the daemon tells us its size
+                if response.content_length is not None and response.content_length > max_size_bytes:
+                    logging.error(f"Content from CID {cid} is {response.content_length} bytes, exceeding max size of {max_size_bytes} bytes. Skipping download.")
+                    response.close()
+                    return None
+
+                if response.content_length is not None and response.content_length <= _FAST_PATH_MAX_BYTES:
+                    # Small body of known size: one read() instead of the chunked loop
+                    content_bytes = await response.read()
+                else:
+                    content_bytes = await _read_limited(response, cid, max_size_bytes)
+                    if content_bytes is None:
                         return None
-                    content_bytes += chunk
 
                 if not content_bytes:
                     logging.warning(f"No content found for CID: {cid}")
                     return None
                 
                 try:
-                    json_data = json.loads(content_bytes.decode('utf-8'))
+                    json_data = orjson.loads(content_bytes) # Decodes the raw bytes directly; invalid UTF-8 is a JSONDecodeError too
                     logging.debug(f"Successfully parsed JSON from CID: {cid}")
                     return json_data
-                except json.JSONDecodeError as e_json:
+                except orjson.JSONDecodeError as e_json:
                     logging.error(f"Failed to decode JSON from CID {cid}. Error: {e_json}. Content (first 100 bytes): {content_bytes[:100]}...")
                     return None
-                except UnicodeDecodeError as e_unicode:
-                    logging.error(f"Failed to decode content as UTF-8 from CID {cid}. Error: {e_unicode}. Content (first 100 bytes): {content_bytes[:100]}...")
-                    return None
+        return await _with_retry(_attempt)
                     
     except aiohttp.ClientResponseError as e_http:
-        if e_http.status == 404 or (e_http.status == 500 and ("not found" in str(e_http.message).lower() or "failed to get block" in str(e_http.message).lower())):
+        if e_http.status == 404 or (e_http.status == 500 and _message_matches(e_http.message, _CID_UNAVAILABLE_PATTERNS)):
              logging.warning(f"CID {cid} not found or unavailable on IPFS node: {e_http.status} {e_http.message}")
         else:
             logging.error(f"HTTP error while fetching CID {cid}: {e_http.status} {e_http.message}")
@@ -292,59 +671,53 @@ async def get_json_from_cid(cid: str, timeout_seconds: int = 30, max_size_bytes:
         logging.error(f"Unexpected error while fetching JSON from CID {cid}: {e_exc}", exc_info=True)
     return None
 
-async def trigger_garbage_collection(timeout_seconds: int = 300) -> list[dict] | None:
+async def trigger_garbage_collection(timeout_seconds: int = 300, abort_on_error: bool = False) -> list[dict] | None:
     """Triggers IPFS repository garbage collection using aiohttp.
     The /api/v0/repo/gc endpoint streams JSON objects.
     Args:
         timeout_seconds: Total timeout for the entire GC operation.
+        abort_on_error: Stop reading (and drop the connection, which cancels the GC run)
+            at the first event that reports an error, instead of draining the whole stream.
     Returns:
         A list of response objects from the IPFS daemon, or None if an error occurred.
     """
-    url = f"{IPFS_API_BASE_URL}/repo/gc"
+    url = _URL_REPO_GC
     logging.info(f"Attempting to trigger IPFS garbage collection via {url}")
     
     gc_responses = []
     try:
         # Use a longer timeout for GC as it can take time
-        timeout = aiohttp.ClientTimeout(total=timeout_seconds) 
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # The stream=True parameter for the request is not directly available in client.post like in `requests`.
-            # Instead, we process the response content as a stream.
-            async with session.post(url) as response: # repo/gc uses POST
-                response.raise_for_status() # Check for initial HTTP errors
-                
-                # IPFS repo/gc streams newline-delimited JSON objects.
-                # We need to read the stream line by line (or by object).
-                # aiohttp's response.content is an StreamReader.
-                buffer = b''
-                async for line_bytes in response.content: # iter_any() might be too coarse, iter_chunked or readline
-                    buffer += line_bytes
-                    # Try to decode buffered lines, as JSON objects are newline-delimited
-                    while b'\n' in buffer:
-                        json_line, buffer = buffer.split(b'\n', 1)
-                        if json_line.strip(): # Ensure it's not an empty line
-                            try:
-                                gc_event = json.loads(json_line.decode('utf-8'))
-                                gc_responses.append(gc_event)
-                                logging.debug(f"GC progress: {gc_event}")
-                                if isinstance(gc_event, dict) and "Error" in gc_event and gc_event["Error"]:
-                                    logging.error(f"IPFS GC event reported an error: {gc_event['Error']}")
-                            except json.JSONDecodeError as e:
-                                logging.warning(f"Could not decode GC event line as JSON: {json_line.decode('utf-8', errors='ignore')}. Error: {e}")
+        timeout = _get_timeout(timeout_seconds) 
+        session = await get_session()
+        # The stream=True parameter for the request is not directly available in client.post like in `requests`.
+        # Instead, we process the response content as a stream.
+        async with session.post(url, timeout=timeout) as response: # repo/gc uses POST
+            response.raise_for_status() # Check for initial HTTP errors
                 
-                # Process any remaining data in the buffer after the loop
-                if buffer.strip():
-                    try:
-                        gc_event = json.loads(buffer.decode('utf-8'))
-                        gc_responses.append(gc_event)
-                        logging.debug(f"GC progress (final buffer): {gc_event}")
-                        if isinstance(gc_event, dict) and "Error" in gc_event and gc_event["Error"]:
-                            logging.error(f"IPFS GC event (final buffer) reported an error: {gc_event['Error']}")
-                    except json.JSONDecodeError as e:
-                        logging.warning(f"Could not decode final GC event buffer as JSON: {buffer.decode('utf-8', errors='ignore')}. Error: {e}")
-
-            logging.info(f"IPFS garbage collection completed. {len(gc_responses)} events received.")
-            return gc_responses
+            # IPFS repo/gc streams newline-delimited JSON objects.
+            # aiohttp's response.content is a StreamReader; readline() hands back one framed event at a time
+            # (the last one may lack a trailing newline) and returns b'' at EOF.
+            while True:
+                json_line = await response.content.readline()
+                if not json_line:
+                    break
+                if not json_line.strip(): # Skip empty lines
+                    continue
+                try:
+                    gc_event = orjson.loads(json_line)
+                    gc_responses.append(gc_event)
+                    logging.debug(f"GC progress: {gc_event}")
+                    if isinstance(gc_event, dict) and gc_event.get("Error"):
+                        logging.error(f"IPFS GC event reported an error: {gc_event['Error']}")
+                        if abort_on_error:
+                            response.close()
+                            logging.warning(f"Aborted IPFS garbage collection after an error. {len(gc_responses)} events received.")
+                            return gc_responses
+                except orjson.JSONDecodeError as e:
+                    logging.warning(f"Could not decode GC event line as JSON: {json_line.decode('utf-8', errors='ignore')}. Error: {e}")
+
+        logging.info(f"IPFS garbage collection completed. {len(gc_responses)} events received.")
+        return gc_responses
             
     except aiohttp.ClientResponseError as e:
         logging.error(f"HTTP error during garbage collection: {e.status} {e.message}")
@@ -379,6 +752,7 @@ async def main_test():
 
     # More tests will be added as other functions are refactored.
     logging.info("IPFS utils (aiohttp) partial test finished.")
+    await aclose()
 
 if __name__ == "__main__":
     asyncio.run(main_test()) 
\ No newline at end of file
@@ -1,18 +1,19 @@
 # Main application logic for the IPFS miner service
 import asyncio
 import logging
-import json
-import os
+import orjson
+import re
 import time
 import binascii # Added for hex decoding
 import coloredlogs # Import coloredlogs
+from functools import lru_cache
 
 import db_manager
 import ipfs_utils
 import substrate_interface
 import config_manager # Import the whole module to access its pre-defined config variables
 from ipfs_peers import PeersConnector
-from version_checker import check_for_updates
+import version_checker
 
 
 # Configuration values are now accessed via config_manager.VARIABLE_NAME
@@ -20,6 +21,17 @@ from version_checker import check_for_updates
 # MAX_PIN_RETRIES = int(os.environ.get("MAX_PIN_RETRIES", 5))
 # UNPINNABLE_CIDS_REPORT_FILE = os.environ.get("UNPINNABLE_CIDS_REPORT_FILE", "unpinnable_cids_report.json")
 
+# Shapes of typical CIDs: CIDv0 ("Qm..." of length 46), CIDv1 in base32 ("bafy...") and libp2p keys in base36 ("k...")
+_CID_RE = re.compile(r"Qm[1-9A-HJ-NP-Za-km-z]{44}|bafy[a-z2-7]{47,}|k[0-9a-z]{50,}")
+_HEX_CHARS = frozenset('0123456789abcdefABCDEF')
+
+# Set when a loop changes what should be pinned, so that loop ends with a reconciliation
+_pins_changed = True
+# CIDs unpinned since the last garbage collection; GC only frees space once something was unpinned
+_unpins_since_gc = 0
+# What the IPFS node still has pinned after the startup cleanup, handed once to the startup reconciliation
+_startup_ipfs_pins: set[str] | None = None
+
 # Get own IPFS Node ID - this is crucial for querying the correct profile
 MY_IPFS_NODE_ID = None # Will be fetched at startup
 
@@ -46,9 +58,20 @@ def decode_profile_file_hash_to_cid(file_hash_array: list[int]) -> str | None:
     """Decodes the file_hash array (list of ASCII values for a hex string) from the profile into a CID string."""
     if not file_hash_array:
         return None
+    try:
+        return _decode_file_hash(tuple(file_hash_array))
+    except TypeError as e: # Not a list of ints, so it can't be a cache key (or decoded)
+        logging.error(f"Error decoding file_hash_array {file_hash_array}: {e}")
+        return None
+
+@lru_cache(maxsize=4096) # Profile items are re-decoded each time the profile is processed, with the same file hashes
+def _decode_file_hash(file_hash_array: tuple[int, ...]) -> str | None:
     try:
         # Convert list of ASCII values to a hex string
-        hex_string = "".join(chr(val) for val in file_hash_array)
+        try:
+            hex_string = bytes(file_hash_array).decode('ascii')
+        except ValueError: # Values outside the ASCII range; keep them as characters as before
+            hex_string = "".join(chr(val) for val in file_hash_array)
         
         # Now, this hex_string is assumed to be what substrate_interface.decode_hex_bytes_to_cid_string expects
         # or it might be a direct base16 CID string. Let's reuse that logic carefully.
@@ -63,9 +86,7 @@ def decode_profile_file_hash_to_cid(file_hash_array: list[int]) -> str | None:
             cid_bytes = binascii.unhexlify(hex_string)
             cid_candidate = cid_bytes.decode('utf-8')
             # Basic validation for typical CID patterns
-            if (cid_candidate.startswith('Qm') and len(cid_candidate) == 46) or \
-               (cid_candidate.startswith('bafy') and len(cid_candidate) > 50) or \
-               (cid_candidate.startswith('k') and len(cid_candidate) > 50):
+            if _CID_RE.fullmatch(cid_candidate):
                 logging.debug(f"Decoded file_hash (as hex of UTF-8) '{hex_string}' to CID: {cid_candidate}")
                 return cid_candidate
             else:
@@ -75,8 +96,8 @@ def decode_profile_file_hash_to_cid(file_hash_array: list[int]) -> str | None:
             # If unhexlify or UTF-8 decode fails, it might be a direct base16 CID string (without 0x)
             # or some other direct representation the IPFS client can handle.
             # Basic check if it looks like a hex string that could be a base16 CID
-            is_likely_hex = all(c in '0123456789abcdefABCDEF' for c in hex_string)
-            if is_likely_hex and (hex_string.lower().startswith('f0') or hex_string.lower().startswith('01') or len(hex_string) > 40):
+            # The prefix/length test is cheap, so it goes first. Not bytes.fromhex(): base16 CIDs ('f' + hex) have odd length.
+            if (hex_string[:2].lower() in ('f0', '01') or len(hex_string) > 40) and _HEX_CHARS.issuperset(hex_string):
                 logging.warning(f"Could not decode file_hash '{hex_string}' as hex of UTF-8. Assuming it is a direct base16 CID or similar.")
                 return hex_string # Return the cleaned hex string
             else:
@@ -87,6 +108,17 @@ def decode_profile_file_hash_to_cid(file_hash_array: list[int]) -> str | None:
         logging.error(f"Error decoding file_hash_array {file_hash_array}: {e}", exc_info=True)
         return None
 
+def cids_from_profile_content(profile_content: list) -> set[str]:
+    """Returns the CIDs named by the file_hash of the profile items.
+    Items without a decodable one are skipped, and how many were is logged.
+    """
+    file_hashes = [item.get('file_hash') for item in profile_content if isinstance(item, dict)]
+    cids = [cid for cid in map(decode_profile_file_hash_to_cid, filter(None, file_hashes)) if cid]
+    skipped = len(profile_content) - len(cids)
+    if skipped:
+        logging.warning(f"Could not decode file_hash from {skipped} of {len(profile_content)} profile items; they were skipped.")
+    return set(cids)
+
 async def get_self_ipfs_node_id():
     """Fetches and returns the node ID from the Substrate node instead of the IPFS daemon."""
     global MY_IPFS_NODE_ID
@@ -106,8 +138,32 @@ async def get_self_ipfs_node_id():
         logging.error(f"Error fetching node ID from Substrate: {e}", exc_info=True)
         return None
 
+async def unpin_all_except(desired_cids: set[str], log_prefix: str):
+    """Aggressive startup cleanup: unpins every CID on the IPFS node that is not in desired_cids.
+    The pins left afterwards are kept in _startup_ipfs_pins.
+    """
+    global _startup_ipfs_pins
+    try:
+        currently_pinned_on_ipfs = set(await ipfs_utils.list_pinned_cids())
+        logging.info(f"{log_prefix} Found {len(currently_pinned_on_ipfs)} CIDs currently pinned on IPFS node.")
+        cids_to_unpin_on_startup = list(currently_pinned_on_ipfs - desired_cids)
+        _startup_ipfs_pins = currently_pinned_on_ipfs
+        if cids_to_unpin_on_startup:
+            logging.info(f"{log_prefix} Found {len(cids_to_unpin_on_startup)} CIDs to unpin: {cids_to_unpin_on_startup}")
+            results = await ipfs_utils.unpin_many(cids_to_unpin_on_startup, concurrency=config_manager.PIN_CONCURRENCY)
+            _startup_ipfs_pins = currently_pinned_on_ipfs.difference(
+                cid for cid, ok in zip(cids_to_unpin_on_startup, results) if ok is True)
+        else:
+            logging.info(f"{log_prefix} No CIDs found on IPFS that need immediate unpinning based on the profile.")
+    except Exception as e_cleanup:
+        logging.error(f"{log_prefix} Error during startup IPFS cleanup: {e_cleanup}", exc_info=True)
+
 async def fetch_and_process_profile(is_startup: bool = False):
-    """Fetches the miner's profile CID from chain, parses profile, and updates DB for pinning/unpinning."""
+    """Fetches the miner's profile CID from chain, parses profile, and updates DB for pinning/unpinning.
+    At startup the profile is always processed, and anything pinned on the IPFS node that the profile
+    doesn't ask for is unpinned.
+    """
+    global _pins_changed
     log_prefix = "[Startup Profile]" if is_startup else "[Periodic Profile]"
     logging.info(f"{log_prefix} Fetching miner profile CID from chain for node ID: {MY_IPFS_NODE_ID}")
     
@@ -125,14 +181,14 @@ async def fetch_and_process_profile(is_startup: bool = False):
         if current_db_profile_cid: # If a profile was active, and now it's gone from chain
             logging.info(f"{log_prefix} Chain profile cleared. Deactivating local profile {current_db_profile_cid} and marking its content for unpinning.")
             await db_manager.set_active_miner_profile(None) # Deactivate
-            # Mark all CIDs from the old (now cleared) profile for unpinning
-            db_managed_cids_tuples = await db_manager.get_cids_by_status('pinned') + \
-                                     await db_manager.get_cids_by_status('pending_pin') + \
-                                     await db_manager.get_cids_by_status('failed_pin')
-            for cid_to_remove, _, _ in db_managed_cids_tuples:
-                # This includes the old profile document CID itself if it was in pinned_cids
-                logging.info(f"{log_prefix} Marking CID {cid_to_remove} (from cleared profile) for unpinning.")
-                await db_manager.update_cid_status(cid_to_remove, 'unpin_requested')
+            _pins_changed = True
+            # Mark all CIDs from the old (now cleared) profile for unpinning.
+            # This includes the old profile document CID itself if it was in pinned_cids.
+            _, cids_to_remove = await db_manager.sync_profile_cids((), keep_cids=())
+            for cid_to_remove in cids_to_remove:
+                logging.info(f"{log_prefix} Marked CID {cid_to_remove} (from cleared profile) for unpinning.")
+        if is_startup:
+            await unpin_all_except(set(), log_prefix)
         return # Nothing further to do if no profile on chain
 
     # A profile CID exists on chain
@@ -147,6 +203,7 @@ async def fetch_and_process_profile(is_startup: bool = False):
 
     logging.info(f"{log_prefix} Profile CID is '{on_chain_profile_cid}' (DB was '{current_db_profile_cid}'). Processing.")
     await db_manager.set_active_miner_profile(on_chain_profile_cid)
+    _pins_changed = True
     
     if await ipfs_utils.pin_cid(on_chain_profile_cid):
         await db_manager.update_miner_profile_pinned_status(on_chain_profile_cid, True)
@@ -156,208 +213,215 @@ async def fetch_and_process_profile(is_startup: bool = False):
         profile_content = await ipfs_utils.get_json_from_cid(on_chain_profile_cid)
         if not profile_content or not isinstance(profile_content, list):
             logging.error(f"{log_prefix} Failed to fetch/parse valid list content from profile {on_chain_profile_cid}. Pin list not updated from content.")
+            if is_startup:
+                await unpin_all_except({on_chain_profile_cid}, log_prefix)
             return
 
-        cids_from_profile = set()
-        for item in profile_content:
-            if isinstance(item, dict) and 'file_hash' in item:
-                target_cid = decode_profile_file_hash_to_cid(item['file_hash'])
-                if target_cid:
-                    cids_from_profile.add(target_cid)
-                else:
-                    logging.warning(f"{log_prefix} Could not decode file_hash from profile item: {item}")
+        cids_from_profile = cids_from_profile_content(profile_content)
         logging.info(f"{log_prefix} Found {len(cids_from_profile)} CIDs to manage from profile content.")
 
-        db_managed_cids_tuples = await db_manager.get_cids_by_status('pinned') + \
-                                 await db_manager.get_cids_by_status('pending_pin') + \
-                                 await db_manager.get_cids_by_status('failed_pin')
-        current_managed_cids_in_db = {t[0] for t in db_managed_cids_tuples if t[0] != on_chain_profile_cid}
-        if current_db_profile_cid and current_db_profile_cid != on_chain_profile_cid:
-            current_managed_cids_in_db.discard(current_db_profile_cid)
-
-        for cid_to_add in (cids_from_profile - current_managed_cids_in_db):
-            logging.info(f"{log_prefix} Adding/marking CID {cid_to_add} for pinning.")
-            await db_manager.add_cid_to_pin(cid_to_add)
-
-        for cid_to_remove in (current_managed_cids_in_db - cids_from_profile):
-            logging.info(f"{log_prefix} Marking CID {cid_to_remove} for unpinning.")
-            await db_manager.update_cid_status(cid_to_remove, 'unpin_requested')
+        # One transaction queues the profile's new CIDs and marks managed CIDs it no longer lists for unpinning.
+        # The profile documents themselves (new and previous) are left alone.
+        added_count, cids_to_remove = await db_manager.sync_profile_cids(
+            cids_from_profile, keep_cids={on_chain_profile_cid, current_db_profile_cid})
+        if added_count:
+            logging.info(f"{log_prefix} Added {added_count} CIDs for pinning.")
+        for cid_to_remove in cids_to_remove:
+            logging.info(f"{log_prefix} Marked CID {cid_to_remove} for unpinning.")
+
+        if is_startup:
+            await unpin_all_except(cids_from_profile | {on_chain_profile_cid}, log_prefix)
     else:
         await db_manager.update_miner_profile_pinned_status(on_chain_profile_cid, False)
         await db_manager.update_cid_status(on_chain_profile_cid, 'failed_pin', 1)
         logging.error(f"{log_prefix} CRITICAL: Failed to pin profile document {on_chain_profile_cid}. Cannot process its content.")
+        if is_startup:
+            await unpin_all_except({on_chain_profile_cid}, log_prefix)
     logging.info(f"{log_prefix} Profile processing finished.")
 
-async def process_pending_pins():
-    """Processes CIDs in the 'pending_pin' state."""
-    pending_cids = await db_manager.get_cids_by_status('pending_pin')
-    if not pending_cids:
-        logging.debug("No CIDs in pending_pin state.")
+async def process_pin_queue():
+    """Pins CIDs in the 'pending_pin' and 'failed_pin' states that haven't reached max retries.
+    Failed CIDs that already have are moved to the unpinnable list first.
+    """
+    global _pins_changed
+    if await db_manager.retire_maxed_out_pins(config_manager.MAX_PIN_RETRIES):
+        _unpinnable_added.set()
+    queued_cids = await db_manager.get_retryable_pins(config_manager.MAX_PIN_RETRIES)
+    if not queued_cids:
+        logging.debug("No CIDs in pending_pin or failed_pin state to pin.")
         return
-    
-    logging.info(f"Found {len(pending_cids)} CIDs to attempt pinning.")
-    for cid, retry_count in pending_cids:
-        logging.info(f"Attempting to pin CID: {cid} (Retry: {retry_count})")
-        success = await ipfs_utils.pin_cid(cid)
+
+    logging.info(f"Found {len(queued_cids)} CIDs to attempt pinning.")
+    _pins_changed = True
+    results = await ipfs_utils.pin_many([cid for cid, _, _ in queued_cids], concurrency=config_manager.PIN_CONCURRENCY)
+    # Outcomes are written back in one transaction each once all pins have finished
+    status_updates = []
+    unpinnable = []
+    for (cid, status, retry_count), success in zip(queued_cids, results):
+        if isinstance(success, Exception):
+            logging.error(f"Error pinning CID {cid} (Retry: {retry_count}): {success}")
+            success = False
         if success:
-            await db_manager.update_cid_status(cid, 'pinned')
-            logging.info(f"Successfully pinned {cid}.")
+            status_updates.append((cid, 'pinned', None))
+            logging.info(f"Successfully pinned {cid}" + (" from failed_pin state." if status == 'failed_pin' else "."))
         else:
             new_retry_count = retry_count + 1
             if new_retry_count >= config_manager.MAX_PIN_RETRIES:
                 logging.warning(f"CID {cid} failed pinning after {new_retry_count} retries. Marking as unpinnable.")
-                await db_manager.remove_cid_from_pinning(cid) # Remove from pinned_cids
-                await db_manager.add_unpinnable_cid(cid, f"Failed after {new_retry_count} retries.")
+                unpinnable.append((cid, f"Failed after {new_retry_count} retries."))
             else:
-                await db_manager.update_cid_status(cid, 'failed_pin', new_retry_count)
+                status_updates.append((cid, 'failed_pin', new_retry_count))
                 logging.info(f"Failed to pin {cid}. Will retry. New count: {new_retry_count}")
-
-async def process_failed_pins():
-    """Retries CIDs in the 'failed_pin' state if they haven't reached max retries."""
-    # This is largely covered by process_pending_pins if failed pins are reset to pending_pin on add_cid_to_pin.
-    # However, this function can specifically target those that remained in failed_pin.
-    failed_cids = await db_manager.get_cids_by_status('failed_pin')
-    if not failed_cids:
-        logging.debug("No CIDs in failed_pin state to retry.")
-        return
-
-    logging.info(f"Found {len(failed_cids)} CIDs in failed_pin state to re-attempt pinning.")
-    for cid, retry_count in failed_cids:
-        if retry_count >= config_manager.MAX_PIN_RETRIES:
-            logging.warning(f"CID {cid} already at max retries ({retry_count}). Marking as unpinnable without further retry.")
-            await db_manager.remove_cid_from_pinning(cid)
-            await db_manager.add_unpinnable_cid(cid, f"Reached max retries ({retry_count}) in failed_pin state.")
-            continue
-
-        logging.info(f"Re-attempting to pin CID: {cid} (Retry: {retry_count})")
-        success = await ipfs_utils.pin_cid(cid)
-        if success:
-            await db_manager.update_cid_status(cid, 'pinned')
-            logging.info(f"Successfully pinned {cid} from failed_pin state.")
-        else:
-            new_retry_count = retry_count + 1
-            if new_retry_count >= config_manager.MAX_PIN_RETRIES:
-                logging.warning(f"CID {cid} failed pinning again, total {new_retry_count} retries. Marking as unpinnable.")
-                await db_manager.remove_cid_from_pinning(cid)
-                await db_manager.add_unpinnable_cid(cid, f"Failed after {new_retry_count} retries.")
-            else:
-                await db_manager.update_cid_status(cid, 'failed_pin', new_retry_count)
-                logging.info(f"Still failed to pin {cid}. Will retry. New count: {new_retry_count}")
+    await db_manager.update_cid_statuses(status_updates)
+    if unpinnable:
+        await db_manager.mark_cids_unpinnable(unpinnable)
+        _unpinnable_added.set()
 
 async def process_unpin_requests():
     """Processes CIDs in the 'unpin_requested' state."""
+    global _pins_changed, _unpins_since_gc
     unpin_requests = await db_manager.get_cids_by_status('unpin_requested')
     if not unpin_requests:
         logging.debug("No CIDs in unpin_requested state.")
         return
 
     logging.info(f"Found {len(unpin_requests)} CIDs to attempt unpinning.")
-    for cid, _ in unpin_requests: # retry_count not typically used for unpinning
-        logging.info(f"Attempting to unpin CID: {cid}")
-        success = await ipfs_utils.unpin_cid(cid)
+    _pins_changed = True
+    cids = [cid for cid, _ in unpin_requests] # retry_count not typically used for unpinning
+    results = await ipfs_utils.unpin_many(cids, concurrency=config_manager.PIN_CONCURRENCY)
+    unpinned = []
+    failed = []
+    for cid, success in zip(cids, results):
+        if isinstance(success, Exception):
+            logging.error(f"Error unpinning CID {cid}: {success}")
+            success = False
         if success:
             # Mark as 'unpinned' or remove from pinned_cids table entirely
-            await db_manager.remove_cid_from_pinning(cid)
-            # Or: await db_manager.update_cid_status(cid, 'unpinned') 
+            unpinned.append(cid)
+            # Or: status 'unpinned' via db_manager.update_cid_statuses()
             logging.info(f"Successfully unpinned {cid} and removed from DB tracking.")
         else:
             # Unpinning failures are less common unless CID was never pinned or IPFS error
             # For now, just log. Could add retries if needed.
             logging.error(f"Failed to unpin {cid}. It might not have been pinned or an IPFS error occurred.")
             # Optionally, remove from DB or mark as failed_unpin if retries are desired.
-            await db_manager.update_cid_status(cid, 'failed_pin') # Or a new status like 'failed_unpin'
-
-async def reconcile_ipfs_pins():
-    """Compares pins in IPFS with the local database and corrects discrepancies."""
+            failed.append((cid, 'failed_pin', None)) # Or a new status like 'failed_unpin'
+    _unpins_since_gc += len(unpinned)
+    await db_manager.remove_cids_from_pinning(unpinned)
+    await db_manager.update_cid_statuses(failed)
+
+async def reconcile_ipfs_pins(ipfs_pinned_cids: set[str] | None = None, include_pending: bool = True):
+    """Compares pins in IPFS with the local database and corrects discrepancies.
+    ipfs_pinned_cids is a listing of the IPFS pins the caller already has; it is fetched when not given.
+    include_pending=False leaves CIDs still waiting in 'pending_pin' to process_pin_queue().
+    """
+    global _unpins_since_gc
     logging.info("Starting IPFS pins reconciliation.")
     try:
-        ipfs_pinned_cids = set(await ipfs_utils.list_pinned_cids())
-        db_should_be_pinned_cids = set(await db_manager.get_all_pinned_cids_from_db())
+        # The set differences are computed by SQLite against a temporary copy of the IPFS pin list
+        if ipfs_pinned_cids is None:
+            ipfs_pinned_cids = await ipfs_utils.list_pinned_cids()
+        only_in_ipfs, only_in_db = await db_manager.diff_pinned_cids(ipfs_pinned_cids, include_pending)
         
         active_profile = await db_manager.get_active_miner_profile()
         active_profile_cid = active_profile[0] if active_profile else None
 
         # CIDs in IPFS but not in DB (or not supposed to be pinned by DB)
-        for cid in ipfs_pinned_cids - db_should_be_pinned_cids:
+        to_unpin = []
+        for cid in only_in_ipfs:
             if cid == active_profile_cid:
-                logging.debug(f"Skipping unpin for active profile CID {cid} found in IPFS but not explicitly in db_should_be_pinned_cids (it should be added there by manage_miner_profile).")
-                # Ensure active profile is in db_should_be_pinned_cids if it wasn't already
-                if active_profile_cid and active_profile_cid not in db_should_be_pinned_cids:
-                    await db_manager.add_cid_to_pin(active_profile_cid)
-                    await db_manager.update_cid_status(active_profile_cid, 'pinned')
+                logging.debug(f"Skipping unpin for active profile CID {cid} found in IPFS but not marked for pinning in the DB (it should be added there by manage_miner_profile).")
+                # Make sure the active profile is tracked as pinned in the DB
+                await db_manager.add_cid_to_pin(active_profile_cid)
+                await db_manager.update_cid_status(active_profile_cid, 'pinned')
                 continue
             logging.warning(f"Reconciliation: CID {cid} pinned in IPFS but not in DB or not marked for pinning. Unpinning.")
-            if await ipfs_utils.unpin_cid(cid):
+            to_unpin.append(cid)
+        results = await ipfs_utils.unpin_many(to_unpin, concurrency=config_manager.PIN_CONCURRENCY)
+        for cid, success in zip(to_unpin, results):
+            if isinstance(success, Exception):
+                logging.error(f"Reconciliation: Error unpinning {cid}: {success}")
+            elif success:
+                _unpins_since_gc += 1
                 logging.info(f"Reconciliation: Successfully unpinned {cid}.")
             else:
                 logging.error(f"Reconciliation: Failed to unpin {cid}.")
 
         # CIDs in DB (marked for pinning) but not in IPFS
-        for cid in db_should_be_pinned_cids - ipfs_pinned_cids:
+        for cid, _ in only_in_db:
             logging.warning(f"Reconciliation: CID {cid} in DB to be pinned, but not found in IPFS. Attempting to pin.")
-            if await ipfs_utils.pin_cid(cid):
-                await db_manager.update_cid_status(cid, 'pinned') # Ensure DB status is correct
+        results = await ipfs_utils.pin_many([cid for cid, _ in only_in_db], concurrency=config_manager.PIN_CONCURRENCY)
+        # Outcomes are written back in one transaction each, like process_pin_queue()
+        status_updates = []
+        unpinnable = []
+        for (cid, current_retry_count), success in zip(only_in_db, results):
+            if success is True:
+                status_updates.append((cid, 'pinned', None)) # Ensure DB status is correct
                 logging.info(f"Reconciliation: Successfully pinned {cid}.")
             else:
                 # This might have been a temporary issue, or it could be an unpinnable CID.
                 # Update status to failed_pin to allow retry logic to handle it.
-                cid_details = await db_manager.get_cid_details(cid)
-                current_retry_count = cid_details[2] if cid_details and cid_details[2] is not None else 0
-                new_retry_count = current_retry_count + 1
+                new_retry_count = (current_retry_count or 0) + 1
 
                 if new_retry_count >= config_manager.MAX_PIN_RETRIES:
                     logging.warning(f"Reconciliation: CID {cid} failed pinning after {new_retry_count} total attempts (discovered during reconciliation). Marking as unpinnable.")
-                    await db_manager.remove_cid_from_pinning(cid)
-                    await db_manager.add_unpinnable_cid(cid, f"Failed after {new_retry_count} retries (discovered during reconciliation).")
+                    unpinnable.append((cid, f"Failed after {new_retry_count} retries (discovered during reconciliation)."))
                 else:
-                    await db_manager.update_cid_status(cid, 'failed_pin', new_retry_count)
+                    status_updates.append((cid, 'failed_pin', new_retry_count))
                     logging.error(f"Reconciliation: Failed to pin {cid}. Marked as failed_pin with retry count {new_retry_count}.")
+        await db_manager.update_cid_statuses(status_updates)
+        if unpinnable:
+            await db_manager.mark_cids_unpinnable(unpinnable)
+            _unpinnable_added.set()
         logging.info("IPFS pins reconciliation finished.")
     except Exception as e:
         logging.error(f"Error during IPFS pins reconciliation: {e}")
 
+# Set whenever CIDs are marked unpinnable, to wake unpinnable_report_writer()
+_unpinnable_added = asyncio.Event()
+REPORT_FLUSH_INTERVAL_SECONDS = 5 # Least time between two report writes
+
+async def unpinnable_report_writer():
+    """Background task that writes the unpinnable CIDs report, so the main loop never waits on it.
+    Runs once at start for CIDs left unreported by a previous run, then whenever new ones are marked;
+    CIDs marked within REPORT_FLUSH_INTERVAL_SECONDS of a write are batched into the next one.
+    """
+    _unpinnable_added.set()
+    while True:
+        await _unpinnable_added.wait()
+        _unpinnable_added.clear()
+        try:
+            await report_unpinnable_cids()
+        except Exception as e:
+            logging.error(f"Error reporting unpinnable CIDs: {e}", exc_info=True)
+        await asyncio.sleep(REPORT_FLUSH_INTERVAL_SECONDS)
+
+def _append_to_file(path: str, data: bytes):
+    """Appends data to a file. Blocking; run it in a worker thread."""
+    with open(path, 'ab') as f:
+        f.write(data)
+
 async def report_unpinnable_cids():
-    """Generates a JSON report of CIDs that could not be pinned."""
+    """Appends CIDs that could not be pinned to the report file, one JSON object per line (JSON Lines).
+    The database records which CIDs have been reported, so each one is written once.
+    """
     cids_to_report = await db_manager.get_unpinnable_cids_to_report()
     if not cids_to_report:
         logging.debug("No new unpinnable CIDs to report.")
         return
 
-    report_data = []
-    try:
-        if os.path.exists(config_manager.UNPINNABLE_CIDS_REPORT_FILE):
-            with open(config_manager.UNPINNABLE_CIDS_REPORT_FILE, 'r') as f:
-                try:
-                    report_data = json.load(f)
-                    if not isinstance(report_data, list):
-                        logging.warning(f"Existing report file {config_manager.UNPINNABLE_CIDS_REPORT_FILE} is not a list. Starting fresh.")
-                        report_data = []
-                except json.JSONDecodeError:
-                    logging.warning(f"Could not decode existing report file {config_manager.UNPINNABLE_CIDS_REPORT_FILE}. Starting fresh.")
-                    report_data = []
-    except Exception as e:
-        logging.error(f"Error reading existing report file {config_manager.UNPINNABLE_CIDS_REPORT_FILE}: {e}")
-        # Continue with an empty list if read fails
-        report_data = [] 
-
-    newly_reported_cids_for_db_update = []
-    for cid, reason in cids_to_report:
-        report_entry = {"cid": cid, "reason": reason, "reported_at": time.time()}
-        if not any(entry.get('cid') == cid for entry in report_data): # Avoid duplicates in the file
-             report_data.append(report_entry)
-        newly_reported_cids_for_db_update.append(cid)
-
+    reported_at = time.time()
+    lines = b"".join(orjson.dumps({"cid": cid, "reason": reason, "reported_at": reported_at}) + b"\n" for cid, reason in cids_to_report)
     try:
-        with open(config_manager.UNPINNABLE_CIDS_REPORT_FILE, 'w') as f:
-            json.dump(report_data, f, indent=4)
-        logging.info(f"Successfully wrote/updated unpinnable CIDs report to {config_manager.UNPINNABLE_CIDS_REPORT_FILE}")
-        if newly_reported_cids_for_db_update:
-            await db_manager.mark_unpinnable_cids_as_reported(newly_reported_cids_for_db_update)
-    except Exception as e:
+        await asyncio.to_thread(_append_to_file, config_manager.UNPINNABLE_CIDS_REPORT_FILE, lines)
+        logging.info(f"Appended {len(cids_to_report)} CIDs to unpinnable CIDs report {config_manager.UNPINNABLE_CIDS_REPORT_FILE}")
+        await db_manager.mark_unpinnable_cids_as_reported([cid for cid, _ in cids_to_report])
+    except OSError as e:
         logging.error(f"Error writing unpinnable CIDs report to {config_manager.UNPINNABLE_CIDS_REPORT_FILE}: {e}")
 
 async def main_loop():
     """The main operational loop for the miner service."""
+    global _pins_changed, _unpins_since_gc
     # MY_IPFS_NODE_ID should already be set by startup()
     if not MY_IPFS_NODE_ID:
         logging.critical("CRITICAL: MY_IPFS_NODE_ID not set at start of main_loop. Exiting.")
@@ -378,32 +442,45 @@ async def main_loop():
 
     logging.info("Miner service main processing loop started (polling mode).")
     
-    gc_counter = 0
+    # GC runs at most every GC_TRIGGER_INTERVAL_LOOPS polling intervals, measured in time so that a slow loop
+    # doesn't stretch it, and only if something was unpinned since the last one
+    gc_interval_seconds = config_manager.GC_TRIGGER_INTERVAL_LOOPS * config_manager.POLLING_INTERVAL_SECONDS
+    last_gc = time.monotonic() # startup() has just run one
+    loops_since_reconcile = 0
 
     while True:
-        # Log current block number at the start of each cycle
-        current_block_num = await substrate_interface.get_current_block_number()
-        if current_block_num is not None:
-            logging.info(f"Current chain block number: {current_block_num}")
-        else:
-            logging.warning("Could not determine current chain block number for this cycle.")
-            
         logging.debug("Main loop iteration starting (profile poll, pin processing, reconciliation, GC check).")
         try:
-            # Poll for profile updates
-            await fetch_and_process_profile()
-            
-            await process_pending_pins()
-            await process_failed_pins()
-            await process_unpin_requests()
-            await reconcile_ipfs_pins() # Still useful for general consistency and old profile doc cleanup
-            await report_unpinnable_cids()
+            # Poll for profile updates; the block number is only logged, so fetch it at the same time
+            current_block_num, _ = await asyncio.gather(
+                substrate_interface.get_current_block_number(),
+                fetch_and_process_profile(),
+            )
+            if current_block_num is not None:
+                logging.info(f"Current chain block number: {current_block_num}")
+            else:
+                logging.warning("Could not determine current chain block number for this cycle.")
 
-            gc_counter += 1
-            if gc_counter >= config_manager.GC_TRIGGER_INTERVAL_LOOPS:
-                logging.info("Triggering periodic IPFS garbage collection.")
-                await ipfs_utils.trigger_garbage_collection()
-                gc_counter = 0
+            await process_pin_queue()
+            await process_unpin_requests()
+            # Still useful for general consistency and old profile doc cleanup. When this loop changed nothing,
+            # it only runs every RECONCILE_INTERVAL_LOOPS to catch changes made to the IPFS node from outside.
+            loops_since_reconcile += 1
+            if _pins_changed or loops_since_reconcile >= config_manager.RECONCILE_INTERVAL_LOOPS:
+                _pins_changed = False
+                loops_since_reconcile = 0
+                await reconcile_ipfs_pins()
+            else:
+                logging.debug("No pin changes this loop. Skipping IPFS pins reconciliation.")
+
+            if time.monotonic() - last_gc >= gc_interval_seconds:
+                if _unpins_since_gc:
+                    logging.info(f"Triggering periodic IPFS garbage collection ({_unpins_since_gc} CIDs unpinned since the last one).")
+                    _unpins_since_gc = 0
+                    await ipfs_utils.trigger_garbage_collection()
+                    last_gc = time.monotonic()
+                else:
+                    logging.debug("Nothing unpinned since the last IPFS garbage collection. Skipping it.")
 
         except BrokenPipeError as e:
             logging.error(f"Broken pipe error in main loop: {e}. Attempting to reconnect to Substrate node.")
@@ -434,8 +511,8 @@ if __name__ == "__main__":
     
     # logging.basicConfig(level=numeric_level, format='%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s') # Old way
 
-    async def startup():
-        global MY_IPFS_NODE_ID
+    async def run_service():
+        global MY_IPFS_NODE_ID, _pins_changed, _startup_ipfs_pins
         MY_IPFS_NODE_ID = await get_self_ipfs_node_id()
         if not MY_IPFS_NODE_ID:
             logging.critical("CRITICAL: Could not determine own IPFS Node ID at startup. Service cannot continue.")
@@ -443,71 +520,55 @@ if __name__ == "__main__":
 
         await db_manager.initialize_database()
         logging.info("Database initialized.")
+        await ipfs_utils.get_session() # Open the shared IPFS API session (and its connection pool) up front
 
-        await check_for_updates()
+        # Checked for newer releases in the background, so a slow GitHub never holds up startup
+        update_checker = asyncio.create_task(version_checker.update_checker_loop())
 
-        # --- Aggressive Startup Cleanup & Pinning ---
-        logging.info("Starting aggressive IPFS cleanup and initial pin setup...")
-        initial_profile_doc_cid = None # Define here to ensure it's in scope for handle_profile_update
-        try:
-            currently_pinned_on_ipfs = set(await ipfs_utils.list_pinned_cids())
-            logging.info(f"Found {len(currently_pinned_on_ipfs)} CIDs currently pinned on IPFS node.")
-
-            initial_profile_doc_cid = await substrate_interface.get_miner_profile_cid(MY_IPFS_NODE_ID)
-            
-            desired_pins_from_profile = set()
-            profile_content_cids = set()
-
-            if initial_profile_doc_cid:
-                logging.info(f"Initial profile document CID from chain: {initial_profile_doc_cid}")
-                desired_pins_from_profile.add(initial_profile_doc_cid)
-                logging.info(f"Attempting to pin initial profile document CID {initial_profile_doc_cid} during startup.")
-                if await ipfs_utils.pin_cid(initial_profile_doc_cid):
-                    logging.info(f"Successfully pinned initial profile document CID {initial_profile_doc_cid}.")
-                    profile_content = await ipfs_utils.get_json_from_cid(initial_profile_doc_cid)
-                    if profile_content and isinstance(profile_content, list):
-                        for item in profile_content:
-                            if isinstance(item, dict) and 'file_hash' in item:
-                                target_cid = decode_profile_file_hash_to_cid(item['file_hash'])
-                                if target_cid:
-                                    profile_content_cids.add(target_cid)
-                        desired_pins_from_profile.update(profile_content_cids)
-                        logging.info(f"Found {len(profile_content_cids)} CIDs within the initial profile content.")
-                    elif profile_content:
-                        logging.warning(f"Initial profile content from {initial_profile_doc_cid} is not a list.")
-                    else:
-                        logging.warning(f"Failed to fetch or parse initial profile content from {initial_profile_doc_cid}.")
-                else:
-                    logging.error(f"Failed to pin initial profile document CID {initial_profile_doc_cid} during startup. Content cannot be processed.")
-            else:
-                logging.warning("No initial profile document CID found on chain for this miner.")
-
-            cids_to_unpin_on_startup = currently_pinned_on_ipfs - desired_pins_from_profile
-            if cids_to_unpin_on_startup:
-                logging.info(f"Startup: Found {len(cids_to_unpin_on_startup)} CIDs to unpin: {cids_to_unpin_on_startup}")
-                for cid_to_unpin in cids_to_unpin_on_startup:
-                    logging.info(f"Startup: Aggressively unpinning {cid_to_unpin}")
-                    await ipfs_utils.unpin_cid(cid_to_unpin)
-            else:
-                logging.info("Startup: No CIDs found on IPFS that need immediate unpinning based on initial profile.")
-
-        except Exception as e_cleanup:
-            logging.error(f"Error during startup IPFS cleanup: {e_cleanup}", exc_info=True)
-        
         # connect existing all peers in registration pallet with local ipfs node  
         ws_url = config_manager.SUBSTRATE_WS_URL if hasattr(config_manager, 'SUBSTRATE_WS_URL') else "ws://127.0.0.1:9944"
         peer_connector = PeersConnector(ws_url=ws_url, block_interval=20, batch_size=10, batch_interval=2, connect_timeout=10)
         asyncio.create_task(peer_connector.run())
 
-        logging.info("Processing initial profile with fetch_and_process_profile to set DB state...")
-        await fetch_and_process_profile(is_startup=True) # block_hash will be None here
+        # --- Aggressive Startup Cleanup & Pinning ---
+        logging.info("Processing initial profile to set DB state, pin its content and clean up other pins...")
+        try:
+            await fetch_and_process_profile(is_startup=True)
+        except Exception as e_startup:
+            logging.error(f"Error processing the initial profile: {e_startup}", exc_info=True)
+
+        # The cleanup above has just listed the IPFS pins; reconcile against that listing now instead of
+        # fetching it again in the first loop, which then only reconciles if it changes pins itself.
+        # CIDs the initial profile just queued are left to the first loop's process_pin_queue(), which
+        # pins them with the usual retry accounting (and marks pins changed, so that loop reconciles).
+        if _startup_ipfs_pins is not None:
+            await reconcile_ipfs_pins(ipfs_pinned_cids=_startup_ipfs_pins, include_pending=False)
+            _startup_ipfs_pins = None
+            _pins_changed = False
 
         logging.info("Performing initial IPFS garbage collection...")
         await ipfs_utils.trigger_garbage_collection()
         logging.info("Initial IPFS garbage collection finished.")
         
+        # Unpinnable CIDs are reported in the background, as the processing below marks them
+        report_writer = asyncio.create_task(unpinnable_report_writer())
+
         # Now that initial state is set up, start the main continuous loop which includes subscription
-        await main_loop()
+        try:
+            await main_loop()
+        finally:
+            report_writer.cancel()
+            update_checker.cancel()
+
+    async def startup():
+        # Release the IPFS session, chain connections and database however the service stops, including during startup
+        try:
+            await run_service()
+        finally:
+            await ipfs_utils.aclose()
+            await version_checker.aclose()
+            await substrate_interface.close_substrate()
+            await db_manager.close_database()
 
     # Use asyncio.run() for cleaner top-level execution if preferred, or manage loop manually.
     # For Python 3.7+ asyncio.run() is the recommended way to run the top-level entry point.
@@ -2,20 +2,31 @@
 import logging
 from substrateinterface import SubstrateInterface, Keypair
 from substrateinterface.exceptions import SubstrateRequestException
+from scalecodec.base import ScaleBytes
+from websocket import WebSocketException
 import os
-import binascii
-from config_manager import SUBSTRATE_NODE_URL
+import re
+import socket
+import threading
+import time
+from config_manager import LOG_LEVEL, SUBSTRATE_NODE_URL, SUBSTRATE_POOL_SIZE
 import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-# Configuration
-# SUBSTRATE_NODE_URL_DEV = "wss://rpc.hippius.network" # Old way
-# SUBSTRATE_NODE_URL_PROD = "ws://127.0.0.1:9944" # Old way
+# Connections are kept open for the life of the process, so have the OS probe idle ones: a node that
+# went away is then noticed (and the connection replaced) instead of hanging the next query.
+# ws_options is passed through to websocket-client's create_connection(), which takes socket options but not
+# WebSocketApp-style ping_interval/ping_timeout.
+_KEEPALIVE_SOCKOPTS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)): # Not available on every platform
+    if hasattr(socket, _name):
+        _KEEPALIVE_SOCKOPTS.append((socket.IPPROTO_TCP, getattr(socket, _name), _value))
+SUBSTRATE_WS_OPTIONS = {'sockopt': tuple(_KEEPALIVE_SOCKOPTS)}
 
-# Determine which URL to use (e.g., via an environment variable or a config file)
-# For now, let's default to dev and allow override via ENV
-# SUBSTRATE_URL = os.environ.get("SUBSTRATE_NODE_URL", SUBSTRATE_NODE_URL_DEV) # Old way
-# Use the value directly from config_manager
-# SUBSTRATE_URL = SUBSTRATE_NODE_URL # This line is redundant as SUBSTRATE_NODE_URL is already the correct value
+def _new_substrate() -> SubstrateInterface:
+    """Opens a new connection to the configured Substrate node."""
+    return SubstrateInterface(url=SUBSTRATE_NODE_URL, ws_options=SUBSTRATE_WS_OPTIONS)
 
 def get_substrate_connection() -> SubstrateInterface | None:
     """Establishes and returns a verified connection to the Substrate node with infinite retries.
@@ -31,7 +42,7 @@ def get_substrate_connection() -> SubstrateInterface | None:
     while True:
         try:
             logging.info(f"Attempt {attempt} to connect to Substrate node at {SUBSTRATE_NODE_URL}...")
-            substrate = SubstrateInterface(url=SUBSTRATE_NODE_URL)
+            substrate = _new_substrate()
             # Verify connection by attempting a simple query
             substrate.get_chain_head()
             logging.info(f"Successfully connected to {SUBSTRATE_NODE_URL} and verified with chain head query.")
@@ -44,16 +55,228 @@ def get_substrate_connection() -> SubstrateInterface | None:
 
         # Clean up if substrate object was partially created
         if substrate:
-            try:
-                substrate.close()
-            except:
-                pass
+            _safe_close(substrate)
             substrate = None
 
         logging.info("Waiting 5 seconds before retrying...")
         time.sleep(5)
         attempt += 1
 
+async def aget_substrate_connection() -> SubstrateInterface:
+    """Async counterpart of get_substrate_connection() that never blocks the event loop.
+
+    Connects and verifies in a worker thread, retrying with exponential backoff
+    (5s, 10s, 20s, ... capped at 60s) until the node answers.
+    """
+    attempt = 1
+    delay = 5
+
+    while True:
+        substrate = None
+        try:
+            logging.info(f"Attempt {attempt} to connect to Substrate node at {SUBSTRATE_NODE_URL}...")
+            substrate = await asyncio.to_thread(_new_substrate)
+            # Verify connection by attempting a simple query
+            await asyncio.to_thread(substrate.get_chain_head)
+            logging.info(f"Successfully connected to {SUBSTRATE_NODE_URL} and verified with chain head query.")
+            return substrate
+
+        except (ConnectionRefusedError, SubstrateRequestException, BrokenPipeError) as e:
+            logging.error(f"Connection error when connecting to Substrate node at {SUBSTRATE_NODE_URL} on attempt {attempt}: {e}")
+        except Exception as e:
+            logging.error(f"General error creating or verifying SubstrateInterface for {SUBSTRATE_NODE_URL} on attempt {attempt}: {e}", exc_info=True)
+
+        if substrate:
+            _safe_close(substrate)
+
+        logging.info(f"Waiting {delay} seconds before retrying...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+        attempt += 1
+
+# Shapes of CID strings we expect from the chain, keyed by their first character: CIDv0 (base58btc "Qm..."
+# of length 46), CIDv1 in base32 ("bafy..." / "bafk...") and libp2p keys in base36 ("k...")
+_CID_PATTERNS = {
+    'Q': re.compile(r"Qm[1-9A-HJ-NP-Za-km-z]{44}"),
+    'b': re.compile(r"baf[yk][a-z2-7]{47,}"),
+    'k': re.compile(r"k[0-9a-z]{50,}"),
+}
+_HEX_DIGITS = b'0123456789abcdef'
+
+def _looks_like_cid(value: str) -> bool:
+    """True if the string has the shape of one of the CID formats above.
+    The first character picks the only format that can match, so other strings (raw hex, mostly) are
+    rejected with one dict lookup, before being hashed for the cache or run through a regex.
+    """
+    pattern = _CID_PATTERNS.get(value[:1])
+    return pattern is not None and _matches_cid_pattern(pattern, value)
+
+@lru_cache(maxsize=2048) # The same profile and file CIDs come back from the chain over and over
+def _matches_cid_pattern(pattern: re.Pattern, value: str) -> bool:
+    return pattern.fullmatch(value) is not None
+
+def _is_connected(substrate: SubstrateInterface) -> bool:
+    """True if the substrate object's websocket is still open."""
+    websocket = getattr(substrate, 'websocket', None)
+    return websocket is not None and getattr(websocket, 'connected', False)
+
+def _safe_close(substrate: SubstrateInterface):
+    """Closes a connection, ignoring errors from an already broken socket."""
+    try:
+        substrate.close()
+    except (OSError, WebSocketException) as e: # OSError includes BrokenPipeError
+        logging.debug(f"Error closing Substrate connection: {e}")
+
+class SubstratePool:
+    """A small pool of long-lived Substrate connections.
+    Each connection holds one websocket, so concurrent queries check out separate connections
+    instead of queueing on one socket. Connections are opened on demand, up to max_size.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self._idle: asyncio.Queue = asyncio.Queue()
+        # One slot per checked-out connection. A connection is only opened when none is idle, so at most
+        # max_size are ever open; a discarded connection gives its slot back, letting a waiter open a new one.
+        self._slots = asyncio.Semaphore(self.max_size)
+
+    async def _checkout(self) -> SubstrateInterface:
+        """Takes an idle connection, or opens one; the caller must already hold a slot."""
+        while True:
+            try:
+                substrate = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                return await aget_substrate_connection()
+            if _is_connected(substrate):
+                return substrate
+            # Went stale while idle; replace it
+            _safe_close(substrate)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Checks out a connection for the duration of the block.
+        A connection that raises ConnectionError (e.g. BrokenPipeError) is closed instead of returned.
+        """
+        async with self._slots:
+            substrate = await self._checkout()
+            try:
+                yield substrate
+            except ConnectionError:
+                _safe_close(substrate)
+                substrate = None
+                raise
+            finally:
+                if substrate is not None:
+                    self._idle.put_nowait(substrate)
+
+    def close_idle(self):
+        """Closes every idle connection; checked-out ones are returned as usual."""
+        while not self._idle.empty():
+            _safe_close(self._idle.get_nowait())
+
+_pool = SubstratePool(SUBSTRATE_POOL_SIZE)
+
+# Query results that change slowly, kept for a short while to skip repeat round-trips
+BLOCK_NUMBER_TTL_SECONDS = 3 # Roughly half a block time
+MINER_PROFILE_TTL_SECONDS = 60
+_ttl_cache: dict[tuple, tuple[object, float]] = {} # key -> (value, expiry)
+_local_peer_id: str | None = None # Never changes while the node is up
+
+def _cache_get(key: tuple):
+    """Returns a cached value, or None if it is missing or expired."""
+    entry = _ttl_cache.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def _cache_put(key: tuple, value, ttl_seconds: float):
+    _ttl_cache[key] = (value, time.monotonic() + ttl_seconds)
+
+# Lookups currently running, keyed like _ttl_cache
+_inflight: dict[tuple, asyncio.Future] = {}
+
+async def _single_flight(key: tuple, fetch):
+    """Runs fetch() once for all callers asking for the same key at the same time; they all get its result.
+    The lookup and insert into _inflight have no await between them, so no lock is needed.
+    """
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(fetch())
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    # A caller being cancelled must not cancel the lookup the others are waiting on
+    return await asyncio.shield(future)
+
+# Latest block number pushed by a chain_subscribeNewHeads subscription (see _watch_block_headers)
+HEAD_WAIT_SECONDS = 15 # How long a caller waits for the first header before falling back to an RPC
+_latest_block_number: int | None = None
+_head_seen: asyncio.Event | None = None
+_head_watcher: asyncio.Task | None = None
+_head_stop = threading.Event()
+_head_substrate: SubstrateInterface | None = None # Connection owned by the subscription thread
+
+def _set_latest_block_number(block_number: int):
+    global _latest_block_number
+    _latest_block_number = block_number
+    _head_seen.set()
+
+async def _watch_block_headers():
+    """Keeps _latest_block_number current from a block header subscription, resubscribing with backoff.
+    The subscription blocks its thread for as long as it runs, so it has its own connection instead of a pooled one.
+    """
+    global _latest_block_number, _head_substrate
+    loop = asyncio.get_running_loop()
+
+    def on_head(block_header, update_nr, subscription_id):
+        if _head_stop.is_set():
+            return True # A non-None return value ends the subscription
+        loop.call_soon_threadsafe(_set_latest_block_number, block_header['header']['number'])
+
+    def subscribe():
+        global _head_substrate
+        _head_substrate = _new_substrate()
+        try:
+            _head_substrate.subscribe_block_headers(on_head)
+        finally:
+            _safe_close(_head_substrate)
+            _head_substrate = None
+
+    delay = 5
+    while not _head_stop.is_set():
+        try:
+            await asyncio.to_thread(subscribe)
+        except Exception as e:
+            if not _head_stop.is_set():
+                logging.warning(f"Block header subscription failed: {e}")
+        if _head_stop.is_set():
+            break
+        if _latest_block_number is not None:
+            delay = 5 # The subscription was working; start the backoff over
+        # The cached number goes stale while unsubscribed
+        _latest_block_number = None
+        _head_seen.clear()
+        logging.info(f"Resubscribing to block headers in {delay} seconds...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+
+def _ensure_head_watcher():
+    """Starts the block header subscription task if it is not already running."""
+    global _head_watcher, _head_seen
+    if _head_watcher is None or _head_watcher.done():
+        _head_stop.clear()
+        _head_seen = asyncio.Event()
+        _head_watcher = asyncio.create_task(_watch_block_headers())
+
+async def close_substrate():
+    """Stops the block header subscription and closes the pooled Substrate connections, e.g. on shutdown."""
+    global _head_watcher
+    _head_stop.set()
+    if _head_substrate is not None:
+        _safe_close(_head_substrate) # Unblocks the subscription thread without waiting for the next header
+    if _head_watcher is not None:
+        _head_watcher.cancel()
+        _head_watcher = None
+    _pool.close_idle()
+
 def decode_hex_bytes_to_cid_string(hex_bytes_value: str) -> str | None:
     """Decodes a hex string (potentially '0x' prefixed) from the chain.
        Assumes the hex string is the hexadecimal representation of the UTF-8 encoded CID string.
@@ -62,46 +285,47 @@ def decode_hex_bytes_to_cid_string(hex_bytes_value: str) -> str | None:
     if not hex_bytes_value:
         logging.warning("Received empty hex_bytes_value for decoding.")
         return None
+
+    # Fast path for the usual chain value: '0x' + hex of an ASCII CID string
+    if hex_bytes_value.startswith('0x') and len(hex_bytes_value) > 4:
+        try:
+            cid_candidate = bytes.fromhex(hex_bytes_value[2:]).decode('ascii')
+            if _looks_like_cid(cid_candidate):
+                return cid_candidate
+        except ValueError:
+            pass # Fall through to the general handling below
     
     # First check if the input is already a valid CID format
-    if (hex_bytes_value.startswith('Qm') and len(hex_bytes_value) == 46) or \
-       (hex_bytes_value.startswith('bafy') and len(hex_bytes_value) > 50) or \
-       (hex_bytes_value.startswith('bafk') and len(hex_bytes_value) > 50) or \
-       (hex_bytes_value.startswith('k') and len(hex_bytes_value) > 50):
-        logging.info(f"Input value '{hex_bytes_value}' is already in CID format. Using as is.")
+    if _looks_like_cid(hex_bytes_value):
+        logging.debug("Input value '%s' is already in CID format. Using as is.", hex_bytes_value)
         return hex_bytes_value
     
-    cleaned_hex = hex_bytes_value.lower()
-    if cleaned_hex.startswith('0x'):
-        cleaned_hex = cleaned_hex[2:]
+    # bytes.fromhex() accepts either case, so the digits are only lowercased if decoding fails
+    cleaned_hex = hex_bytes_value[2:] if hex_bytes_value.startswith(('0x', '0X')) else hex_bytes_value
     
     if not cleaned_hex:
-        logging.warning(f"Hex value became empty after cleaning: {hex_bytes_value}")
+        logging.warning("Hex value became empty after cleaning: %s", hex_bytes_value)
         return None
 
     try:
-        cid_bytes = binascii.unhexlify(cleaned_hex)
+        cid_bytes = bytes.fromhex(cleaned_hex)
         cid_candidate = cid_bytes.decode('utf-8')
-        if (cid_candidate.startswith('Qm') and len(cid_candidate) == 46) or \
-           (cid_candidate.startswith('bafy') and len(cid_candidate) > 50) or \
-           (cid_candidate.startswith('bafk') and len(cid_candidate) > 50) or \
-           (cid_candidate.startswith('k') and len(cid_candidate) > 50):
-            logging.debug(f"Successfully decoded hex '{hex_bytes_value}' to CID string: '{cid_candidate}'")
+        if _looks_like_cid(cid_candidate):
+            logging.debug("Successfully decoded hex '%s' to CID string: '%s'", hex_bytes_value, cid_candidate)
             return cid_candidate
         else:
-            logging.warning(f"Decoded string '{cid_candidate}' from hex '{hex_bytes_value}' does not look like a standard IPFS CID. Using it as is.")
+            logging.warning("Decoded string '%s' from hex '%s' does not look like a standard IPFS CID. Using it as is.", cid_candidate, hex_bytes_value)
             return cid_candidate
             
-    except (binascii.Error, UnicodeDecodeError):
-        is_likely_hex = all(c in '0123456789abcdefABCDEF' for c in cleaned_hex)
-        if is_likely_hex and (cleaned_hex.lower().startswith('f0') or cleaned_hex.lower().startswith('01') or len(cleaned_hex) > 40):
-            logging.warning(f"Could not decode hex '{cleaned_hex}' as UTF-8. Assuming it is a direct base16 CID or similar.")
+    except ValueError: # Invalid hex, or bytes that aren't UTF-8 (UnicodeDecodeError is a ValueError)
+        cleaned_hex = cleaned_hex.lower()
+        # Deleting every hex digit leaves nothing if the string is pure hex
+        is_likely_hex = not cleaned_hex.encode().translate(None, _HEX_DIGITS)
+        if is_likely_hex and (cleaned_hex.startswith(('f0', '01')) or len(cleaned_hex) > 40):
+            logging.warning("Could not decode hex '%s' as UTF-8. Assuming it is a direct base16 CID or similar.", cleaned_hex)
             return cleaned_hex
-        elif (hex_bytes_value.startswith('Qm') and len(hex_bytes_value) == 46) or \
-             (hex_bytes_value.startswith('bafy') and len(hex_bytes_value) > 50) or \
-             (hex_bytes_value.startswith('bafk') and len(hex_bytes_value) > 50) or \
-             (hex_bytes_value.startswith('k') and len(hex_bytes_value) > 50):
-            logging.warning(f"Treating input '{hex_bytes_value}' as a direct CID string as hex decoding failed.")
+        elif _looks_like_cid(hex_bytes_value):
+            logging.warning("Treating input '%s' as a direct CID string as hex decoding failed.", hex_bytes_value)
             return hex_bytes_value
         logging.error(f"Invalid hex string for CID decoding and not a direct CID: '{hex_bytes_value}'.")
         return None
@@ -109,22 +333,61 @@ def decode_hex_bytes_to_cid_string(hex_bytes_value: str) -> str | None:
         logging.error(f"Unexpected error decoding hex '{hex_bytes_value}' to CID string: {e}")
         return None
 
+# Storage item holding each miner's profile CID, keyed by IPFS node ID
+_PROFILE_MODULE = 'IpfsPallet'
+_PROFILE_STORAGE_FUNCTION = 'MinerProfile'
+_PROFILE_STORAGE_KEYS_MAX = 1024
+_profile_storage_keys: dict[str, object] = {} # ipfs_node_id -> StorageKey
+
+def _profile_storage_keys_for(substrate: SubstrateInterface, ipfs_node_ids: list[str]) -> list:
+    """Returns the MinerProfile StorageKey of each node ID, building (and caching) only the missing ones.
+    Building a key resolves the storage function in the metadata and hashes the parameter; the
+    result doesn't depend on the connection, so it is reused across queries.
+    """
+    if len(_profile_storage_keys) > _PROFILE_STORAGE_KEYS_MAX:
+        _profile_storage_keys.clear()
+    storage_keys = []
+    for ipfs_node_id in ipfs_node_ids:
+        storage_key = _profile_storage_keys.get(ipfs_node_id)
+        if storage_key is None:
+            storage_key = substrate.create_storage_key(_PROFILE_MODULE, _PROFILE_STORAGE_FUNCTION, [ipfs_node_id])
+            _profile_storage_keys[ipfs_node_id] = storage_key
+        storage_keys.append(storage_key)
+    return storage_keys
+
+def _query_profiles(substrate: SubstrateInterface, ipfs_node_ids: list[str]) -> list:
+    """Reads MinerProfile for each node ID with one query_multi call. Returns the values in input order."""
+    return [value for _, value in substrate.query_multi(_profile_storage_keys_for(substrate, ipfs_node_ids))]
+
+def _get_profile(substrate: SubstrateInterface, ipfs_node_id: str):
+    """Reads one miner's MinerProfile with a bare state_getStorage call on its prebuilt key.
+    Returns the decoded value, or None if the miner has no profile.
+    """
+    storage_key, = _profile_storage_keys_for(substrate, [ipfs_node_id])
+    response = substrate.rpc_request('state_getStorage', [storage_key.to_hex()])
+    if response.get('result') is None:
+        return None
+    return storage_key.decode_scale_value(ScaleBytes(response['result']))
+
 async def get_miner_profile_cid(ipfs_node_id: str) -> str | None:
     """Queries the Substrate chain for the miner's profile CID.
+    Results are cached for MINER_PROFILE_TTL_SECONDS per node ID, and concurrent callers share one query.
     """
-    substrate = get_substrate_connection()
-    if not substrate:
-        return None
+    cache_key = ('miner_profile', ipfs_node_id)
+    profile_cid_str = _cache_get(cache_key)
+    if profile_cid_str is not None:
+        logging.debug(f"Using cached profile CID {profile_cid_str} for node {ipfs_node_id}")
+        return profile_cid_str
+    return await _single_flight(cache_key, lambda: _fetch_miner_profile_cid(ipfs_node_id))
 
+async def _fetch_miner_profile_cid(ipfs_node_id: str) -> str | None:
+    """Queries and caches the profile CID of one miner. Returns None if it has none or the query failed."""
     profile_cid_str = None
     try:
-        logging.info(f"Querying ipfsPallet.MinerProfile for IPFS node ID: {ipfs_node_id}")
-        params = [ipfs_node_id]
-        result = substrate.query(
-            module='IpfsPallet',
-            storage_function='MinerProfile',
-            params=params
-        )
+        async with _pool.acquire() as substrate:
+            logging.info(f"Querying ipfsPallet.MinerProfile for IPFS node ID: {ipfs_node_id}")
+            # substrate-interface is synchronous; run the RPC in a worker thread so the event loop keeps going
+            result = await asyncio.to_thread(_get_profile, substrate, ipfs_node_id)
         logging.debug(f"Raw result from MinerProfile query: {result}")
 
         if result is not None and hasattr(result, 'value') and result.value is not None:
@@ -133,63 +396,116 @@ async def get_miner_profile_cid(ipfs_node_id: str) -> str | None:
             profile_cid_str = decode_hex_bytes_to_cid_string(hex_encoded_profile_hash)
             if profile_cid_str:
                 logging.info(f"Decoded profile CID: {profile_cid_str} for node {ipfs_node_id}")
+                _cache_put(('miner_profile', ipfs_node_id), profile_cid_str, MINER_PROFILE_TTL_SECONDS)
             else:
                 logging.warning(f"Failed to decode profile hash '{hex_encoded_profile_hash}' to CID for node {ipfs_node_id}.")
         else:
             logging.warning(f"No profile found or empty result for IPFS node ID: {ipfs_node_id}. Result: {result}")
 
+    except ConnectionError as e: # Includes BrokenPipeError; the pool has already dropped the connection
+        logging.error(f"Substrate connection lost when querying MinerProfile for {ipfs_node_id}: {e}")
     except SubstrateRequestException as e:
         logging.error(f"Substrate request failed when querying MinerProfile for {ipfs_node_id}: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred when querying MinerProfile for {ipfs_node_id}: {e}", exc_info=True)
-    finally:
-        if substrate:
-            try: substrate.close()
-            except: pass
-            logging.debug("Substrate connection closed after query attempt.")
     
     return profile_cid_str
 
+async def get_miner_profile_cids(ipfs_node_ids: list[str]) -> dict[str, str | None]:
+    """Looks up the profile CIDs of several miners with one state_queryStorageAt round-trip.
+    Use this rather than concurrent get_miner_profile_cid() calls: substrate-interface can't put
+    several JSON-RPC calls in one frame, but one query can carry any number of storage keys.
+    Returns:
+        A dict mapping each IPFS node ID to its decoded profile CID, or None if it has none or the lookup failed.
+    """
+    results = {}
+    missing = []
+    for ipfs_node_id in dict.fromkeys(ipfs_node_ids): # Drop duplicates, keep order
+        results[ipfs_node_id] = _cache_get(('miner_profile', ipfs_node_id))
+        if results[ipfs_node_id] is None:
+            missing.append(ipfs_node_id)
+    if not missing:
+        return results
+
+    try:
+        async with _pool.acquire() as substrate:
+            logging.info(f"Querying ipfsPallet.MinerProfile for {len(missing)} IPFS node IDs")
+            rows = await asyncio.to_thread(_query_profiles, substrate, missing)
+
+        for ipfs_node_id, result in zip(missing, rows):
+            hex_encoded_profile_hash = result.value if result is not None else None
+            if not hex_encoded_profile_hash:
+                logging.debug(f"No profile found for IPFS node ID: {ipfs_node_id}")
+                continue
+            profile_cid_str = decode_hex_bytes_to_cid_string(hex_encoded_profile_hash)
+            results[ipfs_node_id] = profile_cid_str
+            if profile_cid_str:
+                _cache_put(('miner_profile', ipfs_node_id), profile_cid_str, MINER_PROFILE_TTL_SECONDS)
+    except ConnectionError as e:
+        logging.error(f"Substrate connection lost when querying MinerProfile for {len(missing)} nodes: {e}")
+    except SubstrateRequestException as e:
+        logging.error(f"Substrate request failed when querying MinerProfile for {len(missing)} nodes: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred when querying MinerProfile for {len(missing)} nodes: {e}", exc_info=True)
+    return results
+
 async def get_substrate_node_id() -> str | None:
-    """Fetches the node ID from the Substrate node."""
-    substrate = get_substrate_connection()
-    if not substrate:
-        logging.error("Failed to get substrate connection for fetching node ID.")
-        return None
+    """Fetches the node ID from the Substrate node. The ID is fetched once and then reused."""
+    global _local_peer_id
+    if _local_peer_id is not None:
+        return _local_peer_id
 
     node_id = None
     try:
-        # Query the system for node information using the correct method system_localPeerId
-        response = substrate.rpc_request(method="system_localPeerId", params=[])
+        async with _pool.acquire() as substrate:
+            # Query the system for node information using the correct method system_localPeerId
+            response = await asyncio.to_thread(substrate.rpc_request, method="system_localPeerId", params=[])
         if response and "result" in response:
             node_id = response["result"]
             logging.info(f"Successfully fetched Substrate node ID: {node_id}")
+            _local_peer_id = node_id
             return node_id
         else:
             logging.warning(f"Could not retrieve node ID. Response: {response}")
+    except ConnectionError as e:
+        logging.error(f"Substrate connection lost when fetching node ID: {e}")
     except SubstrateRequestException as e:
         logging.error(f"Substrate request failed when fetching node ID: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred when fetching node ID: {e}", exc_info=True)
-    finally:
-        if substrate:
-            try: substrate.close()
-            except: pass
-            logging.debug("Substrate connection closed after fetching node ID.")
     return node_id
 
 async def get_current_block_number() -> int | None:
-    """Fetches the current (latest) block number of the Substrate chain."""
-    substrate = get_substrate_connection()
-    if not substrate:
-        logging.error("Failed to get substrate connection for fetching block number.")
-        return None
+    """Returns the current (latest) block number of the Substrate chain.
+    Normally this is the number pushed by the block header subscription, with no RPC at all.
+    Until the first header arrives (or while resubscribing) it is fetched with an RPC and
+    cached for BLOCK_NUMBER_TTL_SECONDS; concurrent callers share that RPC.
+    """
+    if _latest_block_number is not None:
+        return _latest_block_number
+    first_start = _head_watcher is None
+    _ensure_head_watcher()
+    if first_start:
+        try:
+            await asyncio.wait_for(_head_seen.wait(), HEAD_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logging.warning(f"No block header received within {HEAD_WAIT_SECONDS}s. Fetching the block number directly.")
+        if _latest_block_number is not None:
+            return _latest_block_number
+
+    block_number = _cache_get(('block_number',))
+    if block_number is not None:
+        return block_number
+    return await _single_flight(('block_number',), _fetch_block_number)
 
+async def _fetch_block_number() -> int | None:
+    """Fetches the latest block number with an RPC and caches it. Returns None on failure."""
     block_number = None
     try:
-        # Get the header of the latest block (head)
-        # The get_block_header() method returns a dict that includes the 'header' key itself.
-        response = substrate.get_block_header() 
+        async with _pool.acquire() as substrate:
+            # Get the header of the latest block (head)
+            # The get_block_header() method returns a dict that includes the 'header' key itself.
+            response = await asyncio.to_thread(substrate.get_block_header)
         if response and 'header' in response and isinstance(response['header'], dict) and 'number' in response['header']:
             block_number = response['header']['number']
             # The block number might be hex (e.g., '0x...') or int depending on library/node.
@@ -202,21 +518,19 @@ async def get_current_block_number() -> int | None:
             
             if block_number is not None:
                 logging.debug(f"Successfully fetched current block number: {block_number}")
+                _cache_put(('block_number',), block_number, BLOCK_NUMBER_TTL_SECONDS)
         else:
             logging.warning(f"Could not retrieve block number from header structure. Response: {response}")
+    except ConnectionError as e:
+        logging.error(f"Substrate connection lost when fetching current block number: {e}")
     except SubstrateRequestException as e:
         logging.error(f"Substrate request failed when fetching current block number: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred when fetching current block number: {e}", exc_info=True)
-    finally:
-        if substrate:
-            try: substrate.close()
-            except: pass
-            logging.debug("Substrate connection closed after fetching block number.")
     return block_number
 
 async def main_test_substrate():
-    logging.basicConfig(level=config_manager.LOG_LEVEL.upper(), format='%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s')
+    logging.basicConfig(level=LOG_LEVEL.upper(), format='%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s')
     test_ipfs_node_id = "12D3KooWACs48y3S1cCAwiqCQ2QZ1koEHfQToiX63mb945YiWFse" 
     
     logging.info(f"Attempting direct fetch for profile CID for IPFS node: {test_ipfs_node_id}")
@@ -267,18 +581,11 @@ async def main_test_substrate():
         logging.error("Failed to fetch current block number in test.")
 
 
-# In substrate_interface.py (or wherever substrate_interface is defined)
 async def reconnect():
-    global substrate
-    substrate = None
-    while True:
-        try:
-            substrate = await asyncio.to_thread(SubstrateInterface, url="ws://127.0.0.1:9944")
-            logging.info("Reconnected to Substrate node.")
-            break
-        except Exception as e:
-            logging.error(f"Reconnection failed: {e}")
-            await asyncio.sleep(5)
+    """Drops idle pooled connections and connects again (used after a BrokenPipeError)."""
+    _pool.close_idle()
+    async with _pool.acquire():
+        logging.info("Reconnected to Substrate node.")
 
 if __name__ == "__main__":
     asyncio.run(main_test_substrate()) 
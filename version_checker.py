@@ -1,49 +1,244 @@
+import asyncio
 import logging
-import requests
-import pkg_resources
+import random
+import time
+from functools import lru_cache
+import aiohttp
+import orjson
+from packaging.version import InvalidVersion, Version
 from config_manager import APP_VERSION
 
-# Configure basic logging for standalone testing
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+logger = logging.getLogger(__name__)
 
-async def check_for_updates():
-    """Check GitHub for newer versions using tags"""
+DEFAULT_REPO = "thenervelab/thebrain" # Checked against APP_VERSION when no repositories are given
+_RELEASES_URL = "https://api.github.com/repos/{repo}/releases/latest"
+# Used if the repository publishes no releases; the newest tag comes first, so one is enough
+_TAGS_URL = "https://api.github.com/repos/{repo}/tags?per_page=1"
+_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=5)
+CACHE_TTL_SECONDS = 900 # How long the newest tag fetched from GitHub is reused
+MAX_RETRIES = 3 # Retries of a request that failed to connect, timed out or got a 5xx from GitHub
+_RETRY_STATUSES = frozenset({500, 502, 503, 504})
+_BACKOFF_FACTOR = 0.5 # Seconds before the first retry; doubles with every further one
+_MAX_RETRY_DELAY_SECONDS = 30 # Cap on a server-requested Retry-After, so a check never stalls for long
+# Largest response body read; a release object carries its notes and asset list, so leave some room
+_MAX_RESPONSE_BYTES = 256 * 1024
+_GITHUB_HEADERS = {'Accept': 'application/vnd.github+json', 'User-Agent': f'miner-ipfs-service/{APP_VERSION}'}
+
+@lru_cache(maxsize=32)
+def _parse_version(version):
+    """Parses a current version string once; returns None if it isn't a valid version (e.g. "unknown")."""
     try:
-        # Get all tags (sorted by newest first)
-        tags_response = requests.get(
-            f"https://api.github.com/repos/thenervelab/thebrain/tags",
-            timeout=5
+        return Version(version)
+    except InvalidVersion:
+        return None
+
+# Per repository: the newest tag seen, when it was fetched (time.monotonic()), the URL and ETag of
+# the response it came from, and the last (current version, tag) pair found to hold no update
+_cache: dict[str, dict] = {}
+# Outcome of the last background check of DEFAULT_REPO, read by get_update_status(); written only by update_checker_loop()
+_status = {'has_update': False, 'latest': None, 'checked_at': None}
+# Wall-clock time (time.time()) until which GitHub has asked us to stop calling the API
+_rate_limited_until = 0.0
+
+# Repeated checks reuse one session, so only the first one pays for the TCP and TLS handshakes with api.github.com
+_session: aiohttp.ClientSession | None = None
+
+def _get_session() -> aiohttp.ClientSession:
+    """Returns the module-wide GitHub API session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=4, ttl_dns_cache=300, keepalive_timeout=75)
+        _session = aiohttp.ClientSession(connector=connector, timeout=_REQUEST_TIMEOUT, headers=_GITHUB_HEADERS)
+    return _session
+
+async def aclose():
+    """Closes the GitHub API session, if one was opened."""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+def _repo_cache(repo):
+    """Returns the cache entry of repo, creating an empty one on first use."""
+    entry = _cache.get(repo)
+    if entry is None:
+        entry = _cache[repo] = {'ts': 0.0, 'latest': None, 'url': _RELEASES_URL.format(repo=repo),
+                                'etag': None, 'no_update': None}
+    return entry
+
+def _compare(entry, repo, current, latest_tag):
+    """Logs how the current version of repo relates to latest_tag; returns True if latest_tag is newer.
+    A pair already found to hold no update returns False straight away, without parsing or logging again.
+    """
+    if entry['no_update'] == (current, latest_tag):
+        return False
+    current_version = _parse_version(current)
+    if current_version is None:
+        logger.debug(f"Cannot compare versions: current version {current!r} of {repo} is not a valid version")
+        return False
+    latest_version = Version(latest_tag.lstrip('v'))
+
+    if latest_version > current_version:
+        logger.warning(
+            f"NEW VERSION AVAILABLE: {latest_tag} (Current: {current})\n"
+            f"Update at: https://github.com/{repo}"
         )
-        tags_response.raise_for_status()
-        
-        tags_data = tags_response.json()
-        if not tags_data:
-            logging.info("No tags found in repository - cannot check versions")
-            return False
-            
-        latest_tag = tags_data[0]['name']  # Gets newest tag
-        current_version = pkg_resources.parse_version(APP_VERSION)
-        latest_version = pkg_resources.parse_version(latest_tag.lstrip('v'))
-        
-        if latest_version > current_version:
-            logging.warning(
-                f"NEW VERSION AVAILABLE: {latest_tag} (Current: {APP_VERSION})\n"
-                f"Update at: https://github.com/thenervelab/thebrain"
-            )
-            return True
-        elif latest_version == current_version:
-            logging.info(f"You're running the latest version: {APP_VERSION}")
+        return True
+    entry['no_update'] = (current, latest_tag)
+    if latest_version == current_version:
+        logger.info(f"You're running the latest version of {repo}: {current}")
+    else:
+        logger.warning(
+            f"Development version of {repo} detected: {current} "
+            f"(Latest stable: {latest_tag})"
+        )
+    return False
+
+def _retry_after_seconds(response):
+    """Returns the delay requested by a Retry-After header in seconds, or None if there is no usable one."""
+    try:
+        return max(0, int(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+def _note_rate_limit(response):
+    """Remembers until when GitHub rate-limits us, if the response says we are."""
+    global _rate_limited_until
+    if response.status not in (403, 429):
+        return
+    retry_after = _retry_after_seconds(response)
+    if retry_after is not None: # Secondary rate limits ask for a pause
+        _rate_limited_until = time.time() + retry_after
+    elif response.headers.get('X-RateLimit-Remaining') == '0':
+        try:
+            _rate_limited_until = float(response.headers['X-RateLimit-Reset']) # Epoch seconds
+        except (KeyError, ValueError):
+            _rate_limited_until = time.time() + CACHE_TTL_SECONDS
+    else:
+        return
+    logger.info(f"GitHub API rate limit reached; skipping version checks for {max(0, _rate_limited_until - time.time()):.0f}s")
+
+async def _get_with_retries(url, headers):
+    """GETs url, retrying connection errors, timeouts and 5xx responses up to MAX_RETRIES times.
+    Waits follow jittered exponential backoff, or the server's Retry-After (capped) when it sends one.
+    Returns the last response, which the caller must release.
+    """
+    session = _get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        delay = _BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, _BACKOFF_FACTOR)
+        try:
+            response = await session.get(url, headers=headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logger.debug(f"Version check request failed ({e!r}); retrying in {delay:.1f}s")
         else:
-            logging.warning(
-                f"Development version detected: {APP_VERSION} "
-                f"(Latest stable: {latest_tag})"
-            )
-            
-    except requests.exceptions.RequestException as e:
-        logging.debug(f"Network error checking versions: {str(e)}")
+            if response.status not in _RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            retry_after = _retry_after_seconds(response)
+            if retry_after is not None:
+                delay = min(retry_after, _MAX_RETRY_DELAY_SECONDS)
+            response.release()
+            logger.debug(f"GitHub answered {response.status}; retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def _fetch_latest_tag(entry, url):
+    """Fetches the newest tag from a releases/latest or tags endpoint; returns None if there is none.
+    Revalidating with the ETag in the repository's cache entry gets an empty 304 when nothing changed,
+    which GitHub doesn't count against the rate limit. Raises aiohttp.ClientResponseError on error statuses.
+    """
+    revalidate = url == entry['url'] and entry['etag'] and entry['latest'] is not None
+    headers = {'If-None-Match': entry['etag']} if revalidate else None
+    # Awaited so the event loop keeps running during the request
+    async with await _get_with_retries(url, headers) as response:
+        _note_rate_limit(response)
+        response.raise_for_status()
+        if response.status == 304:
+            return entry['latest']
+        if (response.content_length or 0) > _MAX_RESPONSE_BYTES:
+            raise ValueError(f"Response of {response.content_length} bytes from {url} is too large")
+        # Read to the end, chunk by chunk, so bodies without a Content-Length are bounded too
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(65536):
+            if len(body) + len(chunk) > _MAX_RESPONSE_BYTES:
+                response.close() # Drop the connection rather than draining the rest of an oversized body
+                raise ValueError(f"Response from {url} exceeds {_MAX_RESPONSE_BYTES} bytes")
+            body.extend(chunk)
+        data = orjson.loads(body)
+        etag = response.headers.get('ETag')
+
+    if url.endswith('/releases/latest'):
+        latest_tag = data.get('tag_name') # A single release object
+    else:
+        latest_tag = data[0]['name'] if data else None # Tags are sorted by newest first
+    entry['url'] = url
+    entry['etag'] = etag
+    return latest_tag
+
+async def _check_one(repo, current):
+    """Checks one repository for a version newer than current; returns True if there is one."""
+    entry = _repo_cache(repo)
+    try:
+        if entry['latest'] is not None and time.monotonic() - entry['ts'] < CACHE_TTL_SECONDS:
+            return _compare(entry, repo, current, entry['latest'])
+        if time.time() < _rate_limited_until:
+            # Keep answering from the last known tag rather than spending requests GitHub would reject
+            return _compare(entry, repo, current, entry['latest']) if entry['latest'] is not None else False
+
+        url = entry['url']
+        try:
+            latest_tag = await _fetch_latest_tag(entry, url)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404 or not url.endswith('/releases/latest'):
+                raise
+            logger.debug(f"No GitHub release published for {repo} - checking tags instead")
+            latest_tag = await _fetch_latest_tag(entry, _TAGS_URL.format(repo=repo))
+        if not latest_tag:
+            logger.info(f"No tags found in repository {repo} - cannot check versions")
+            return False
+
+        entry['ts'] = time.monotonic()
+        entry['latest'] = latest_tag
+        return _compare(entry, repo, current, latest_tag)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Could not check {repo} for updates: {e!r}")
     except Exception as e:
-        logging.debug(f"Version check failed: {str(e)}", exc_info=True)
-    return False
\ No newline at end of file
+        logger.debug(f"Version check of {repo} failed: {str(e)}", exc_info=True)
+    return False
+
+async def check_for_updates(repos=None):
+    """Check GitHub for newer versions using the latest release, or the tags if no release is published.
+    repos is a list of (owner/name, current version) pairs and defaults to DEFAULT_REPO at APP_VERSION;
+    they are checked concurrently over the shared session. Returns True if any of them has a newer version.
+    The newest tag of each is remembered for CACHE_TTL_SECONDS, so frequent callers don't spend the API rate limit.
+    """
+    if repos is None:
+        repos = [(DEFAULT_REPO, APP_VERSION)]
+    results = await asyncio.gather(*(_check_one(repo, current) for repo, current in repos), return_exceptions=True)
+    return any(result is True for result in results)
+
+def get_update_status() -> dict:
+    """Returns the result of the last background check without touching the network:
+    {'has_update': bool, 'latest': newest tag or None, 'checked_at': time.time() of the check or None}.
+    """
+    return dict(_status)
+
+async def update_checker_loop(interval=CACHE_TTL_SECONDS):
+    """Background task: checks DEFAULT_REPO every interval seconds and publishes the outcome for get_update_status()."""
+    while True:
+        has_update = await check_for_updates()
+        _status.update(has_update=has_update, latest=_repo_cache(DEFAULT_REPO)['latest'], checked_at=time.time())
+        await asyncio.sleep(interval)
+
+# Example usage (for testing this module directly)
+async def main_test():
+    # Logging is only configured here; importing the module leaves the application's setup alone
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        logger.info(f"Update available: {await check_for_updates()}")
+    finally:
+        await aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main_test())